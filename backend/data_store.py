@@ -1,42 +1,149 @@
 """
 data_store.py — In-memory data management for the FastAPI backend.
 Replaces Streamlit's @st.cache_data with a simple TTL-based singleton.
+
+Frames are published as immutable DataGeneration objects: a refresh builds a
+complete new generation and swaps a single reference, so readers never see
+df_site from one refresh joined with df_pkg from another. The last
+GENERATION_HISTORY generations stay in memory for instant rollback.
+
+Endpoints taking ?as_of= read generation_as_of(), which rebuilds a generation
+from the newest snapshot at or before that time and keeps the last
+AS_OF_CACHE_SIZE of them in an LRU.
+
+Every generation built in this worker also appends its inserted / updated /
+deleted tasks to the change log (change_log.py, /api/data/changes), on one
+background thread so the log stays in publication order.
+
+With SHARED_DATA_DIR set, workers of a multi-process deployment share one
+refresher and memory-map its generations (see shared_plane.py).
 """
 
 import sys
 import os
 import time
 import logging
-from threading import Lock
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from functools import cached_property
+from threading import Lock, RLock, Thread
 
+import numpy as np
 import pandas as pd
 
 # Add parent directory to path so we can import root-level modules
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
-from config import INMEMORY_TTL_SECONDS
+from config import (
+    SITE_KEY,
+    INMEMORY_TTL_SECONDS,
+    REFRESH_RETRY_SECONDS,
+    GENERATION_HISTORY,
+    AS_OF_CACHE_SIZE,
+    SHARED_DATA_DIR,
+)
 from loader import (
-    fetch_all_csvs,
+    refresh_parts,
+    roll_business_date,
+    split_parts,
+    assemble_parts,
+    load_source_state,
+    save_source_state,
     save_latest_cache,
     load_latest_cache,
     save_snapshot,
     cleanup_old_snapshots,
     get_cache_timestamp,
     load_all_snapshots,
+    find_snapshot,
+    load_site_history,
+    load_snapshot_diff,
+    load_trend_rollup,
 )
 from transform import (
-    clean_tasks,
-    build_site_summary,
+    concat_frames,
     build_package_summary,
     build_district_summary,
     extract_package_metadata,
+    _get_today,
 )
+from change_log import record_changes, read_changes
+from backend.shared_plane import SharedDataPlane
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass(frozen=True)
+class DataGeneration:
+    """
+    One consistent set of frames plus the refresh state they were built from.
+    Never mutated after publication: take store.generation once per request
+    and read all frames from it.
+    """
+
+    id: int
+    df_tasks: pd.DataFrame
+    df_site: pd.DataFrame
+    df_pkg: pd.DataFrame
+    df_dist: pd.DataFrame
+    warnings: tuple[str, ...] = ()
+    cache_ts: str | None = None
+    created_at: str | None = None
+    business_date: str | None = None   # Asia/Karachi date the delay columns were computed for
+    # Per-source (df_tasks, df_site) parts and validators/hashes for the next refresh
+    parts: dict = field(default_factory=dict, repr=False)
+    source_state: dict | None = field(default=None, repr=False)
+
+    @cached_property
+    def site_index(self) -> dict[tuple, int]:
+        """SITE_KEY tuple → row position in df_site."""
+        if self.df_site.empty:
+            return {}
+        keys = zip(*(self.df_site[col] for col in SITE_KEY))
+        return {key: pos for pos, key in enumerate(keys)}
+
+    @cached_property
+    def task_rows(self) -> dict[tuple, np.ndarray]:
+        """SITE_KEY tuple → row positions in df_tasks."""
+        if self.df_tasks.empty:
+            return {}
+        return self.df_tasks.groupby(SITE_KEY, dropna=False, sort=False, observed=True).indices
+
+    def site_row(self, package_name: str, district: str, site_name: str) -> pd.DataFrame:
+        """The df_site row for one site (empty frame if unknown)."""
+        pos = self.site_index.get((package_name, district, site_name))
+        return self.df_site.iloc[[pos]] if pos is not None else self.df_site.iloc[0:0]
+
+    def site_tasks(self, package_name: str, district: str, site_name: str) -> pd.DataFrame:
+        """All df_tasks rows for one site, in original order."""
+        rows = self.task_rows.get((package_name, district, site_name))
+        return self.df_tasks.iloc[rows] if rows is not None else self.df_tasks.iloc[0:0]
+
+    def summary(self) -> dict:
+        return {
+            "generation": self.id,
+            "created_at": self.created_at,
+            "cache_timestamp": self.cache_ts,
+            "business_date": self.business_date,
+            "rows_tasks": len(self.df_tasks),
+            "rows_sites": len(self.df_site),
+        }
+
+
+_EMPTY_GENERATION = DataGeneration(
+    id=0,
+    df_tasks=pd.DataFrame(),
+    df_site=pd.DataFrame(),
+    df_pkg=pd.DataFrame(),
+    df_dist=pd.DataFrame(),
+)
+
+
 class DataStore:
-    """Thread-safe singleton that holds the current data frames."""
+    """Thread-safe singleton that publishes the current data generation."""
 
     _instance = None
     _lock = Lock()
@@ -53,14 +160,60 @@ class DataStore:
         if self._initialized:
             return
         self._initialized = True
-        self._data_lock = Lock()
-        self.df_tasks: pd.DataFrame = pd.DataFrame()
-        self.df_site: pd.DataFrame = pd.DataFrame()
-        self.df_pkg: pd.DataFrame = pd.DataFrame()
-        self.df_dist: pd.DataFrame = pd.DataFrame()
-        self.warnings: list[str] = []
+        self._data_lock = Lock()      # guards the generation swap only
+        self._refresh_lock = RLock()  # serializes fetch/rebuild
+        self._generation: DataGeneration = _EMPTY_GENERATION
+        self._history: deque[DataGeneration] = deque(maxlen=GENERATION_HISTORY)
+        self._next_id = 1
+        self._pinned = False          # set by rollback; pauses background refresh
+        self.fetch_timings: dict[str, float] = {}
         self._last_refresh: float = 0
-        self._cache_ts: str | None = None
+        self._state_lock = Lock()
+        self._refresh_state: dict = {
+            "state": "idle",          # idle | running | failed
+            "trigger": None,
+            "started_at": None,
+            "finished_at": None,
+            "duration_seconds": None,
+            "error": None,
+        }
+        self._refresh_started: float = 0
+        self._refresh_failed_at: float = 0
+        # Generations rebuilt from snapshots for ?as_of=, keyed by snapshot time
+        self._as_of_cache: OrderedDict[datetime, DataGeneration] = OrderedDict()
+        self._as_of_lock = Lock()
+        # Cross-worker refresh lock + shared generations (None = single process)
+        self._plane = SharedDataPlane(SHARED_DATA_DIR) if SHARED_DATA_DIR else None
+        # One thread, so change-log generations are recorded in publish order
+        self._change_log = ThreadPoolExecutor(max_workers=1, thread_name_prefix="change-log")
+
+    # ------------------------------------------------------------------
+    # Read access (lock-free)
+    # ------------------------------------------------------------------
+
+    @property
+    def generation(self) -> DataGeneration:
+        return self._generation
+
+    @property
+    def df_tasks(self) -> pd.DataFrame:
+        return self._generation.df_tasks
+
+    @property
+    def df_site(self) -> pd.DataFrame:
+        return self._generation.df_site
+
+    @property
+    def df_pkg(self) -> pd.DataFrame:
+        return self._generation.df_pkg
+
+    @property
+    def df_dist(self) -> pd.DataFrame:
+        return self._generation.df_dist
+
+    @property
+    def warnings(self) -> list[str]:
+        return list(self._generation.warnings)
 
     @property
     def is_stale(self) -> bool:
@@ -70,75 +223,567 @@ class DataStore:
 
     @property
     def cache_timestamp(self) -> str | None:
-        return self._cache_ts
+        return self._generation.cache_ts
+
+    @property
+    def generations(self) -> list[dict]:
+        """Summaries of the generations held for rollback, oldest first."""
+        return [g.summary() for g in self._history]
+
+    @property
+    def refresh_status(self) -> dict:
+        """Current background/foreground refresh state (for /api/health)."""
+        with self._state_lock:
+            status = dict(self._refresh_state)
+        status["generation"] = self._generation.id
+        status["pinned"] = self._pinned
+        status["shared_generation"] = self._plane.generation if self._plane else None
+        return status
+
+    # ------------------------------------------------------------------
+    # Refresh state tracking
+    # ------------------------------------------------------------------
+
+    def _try_begin_refresh(self, trigger: str, background: bool) -> bool:
+        """Mark a refresh as running. Background refreshes are skipped while one
+        is already running or within REFRESH_RETRY_SECONDS of a failure."""
+        with self._state_lock:
+            if background:
+                if self._refresh_state["state"] == "running":
+                    return False
+                if (self._refresh_state["state"] == "failed"
+                        and time.time() - self._refresh_failed_at < REFRESH_RETRY_SECONDS):
+                    return False
+            self._refresh_started = time.perf_counter()
+            self._refresh_state = {
+                "state": "running",
+                "trigger": trigger,
+                "started_at": datetime.now().isoformat(timespec="seconds"),
+                "finished_at": None,
+                "duration_seconds": None,
+                "error": None,
+            }
+            return True
+
+    def _end_refresh(self, error: str | None = None):
+        with self._state_lock:
+            self._refresh_state.update({
+                "state": "failed" if error else "idle",
+                "finished_at": datetime.now().isoformat(timespec="seconds"),
+                "duration_seconds": round(time.perf_counter() - self._refresh_started, 3),
+                "error": error,
+            })
+            if error:
+                self._refresh_failed_at = time.time()
+
+    def refresh_if_stale(self) -> bool:
+        """
+        Stale-while-revalidate: once INMEMORY_TTL_SECONDS has passed, rebuild on
+        a background thread while callers keep reading the current generation.
+        Paused after a rollback until the next explicit refresh. A business-date
+        change is handled first, on the calling thread (see roll_business_date),
+        after adopting any generation another worker has published, so async
+        callers must run this in a threadpool. Never waits on another refresh.
+        Returns True if a background refresh was started.
+        """
+        self.sync_shared()
+        self.roll_business_date()
+        if self._pinned or not self.is_stale:
+            return False
+        if not self._try_begin_refresh("stale", background=True):
+            return False
+        Thread(target=self._background_refresh, name="data-refresh", daemon=True).start()
+        return True
+
+    def roll_business_date(self) -> bool:
+        """
+        Once the Asia/Karachi date changes, recompute the date-dependent columns
+        of the current generation from its cleaned tasks and publish the result
+        (milliseconds, no network). Skipped while a refresh holds the lock, as
+        that refresh rolls the parts itself. Returns True if a generation was
+        published.
+        """
+        gen = self._generation
+        if gen.df_tasks.empty or gen.business_date == str(_get_today().date()):
+            return False
+        if not self._refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            with self._exclusive(blocking=False) as acquired:
+                if not acquired:
+                    return False   # another worker is refreshing or rolling
+                return self._roll_locked()
+        finally:
+            self._refresh_lock.release()
+
+    def _roll_locked(self) -> bool:
+        """Roll the current generation if still needed. Caller holds both locks."""
+        gen = self._generation
+        if gen.business_date == str(_get_today().date()):
+            return False
+        source_state = gen.source_state if gen.source_state is not None else load_source_state()
+        df_tasks, df_site, source_state = roll_business_date(
+            gen.df_tasks, gen.df_site, source_state
+        )
+        logger.info("Business date changed — recomputed delays of generation %d", gen.id)
+        # Parts are re-split from the rolled frames on the next refresh
+        self._publish(df_tasks, df_site, list(gen.warnings), None, source_state, refreshed=False)
+        return True
+
+    def _background_refresh(self):
+        try:
+            error = None
+            with self._refresh_lock, self._exclusive(blocking=False) as acquired:
+                # Skip if another worker holds the lock or already refreshed
+                if acquired and self.is_stale:
+                    _, error = self._refresh_from_sources(force_refresh=False, background=True)
+            self._end_refresh(error)
+        except Exception as exc:
+            logger.exception("Background refresh failed")
+            self._end_refresh(str(exc))
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
 
     def load(self, force_refresh: bool = False) -> list[str]:
-        """Load data (from cache or fresh). Returns warnings list."""
-        with self._data_lock:
-            if not force_refresh and not self.is_stale and not self.df_tasks.empty:
-                return self.warnings
+        """
+        Load data (from cache or fresh). Returns warnings list.
+        Once data is loaded, a stale store keeps serving it and revalidates in
+        the background (see refresh_if_stale); only a forced refresh or an
+        empty store blocks the caller.
+        """
+        if not force_refresh and not self.df_tasks.empty:
+            self.refresh_if_stale()
+            return self.warnings
 
-            warnings: list[str] = []
-
-            if not force_refresh:
-                df_tasks, df_site = load_latest_cache()
-                if df_tasks is not None and df_site is not None and not df_tasks.empty:
-                    ts = get_cache_timestamp()
-                    warnings.append(f"Loaded from cache ({ts})")
-                    self._set_data(df_tasks, df_site, warnings)
-                    return warnings
-
-            # Fresh fetch
-            df_tasks_raw, succeeded, failed = fetch_all_csvs()
-
-            if failed:
-                warnings.append(f"Failed to load: {', '.join(failed)}")
-
-            if df_tasks_raw.empty:
-                # Fallback to cache
-                df_tasks, df_site = load_latest_cache()
-                if df_tasks is not None and df_site is not None:
-                    ts = get_cache_timestamp()
-                    warnings.append(f"All sources unavailable — cached data from {ts}")
-                    self._set_data(df_tasks, df_site, warnings)
-                    return warnings
-                else:
-                    warnings.append("No data available — check network and try again")
-                    self.warnings = warnings
-                    return warnings
-
-            # Clean and build
-            df_tasks = clean_tasks(df_tasks_raw)
-            df_site = build_site_summary(df_tasks)
-
-            # Persist
-            save_latest_cache(df_tasks, df_site)
+        with self._refresh_lock, self._exclusive():
+            # Another worker may have published while we waited for the lock
+            if not force_refresh and not self.df_tasks.empty:
+                return self.warnings
 
+            self._try_begin_refresh("forced" if force_refresh else "startup", background=False)
             if force_refresh:
-                save_snapshot(df_site)
-                cleanup_old_snapshots()
+                self._pinned = False
+            try:
+                warnings, error = self._load_locked(force_refresh)
+            except Exception as exc:
+                self._end_refresh(str(exc))
+                raise
+            self._end_refresh(error)
+            return warnings
+
+    def _load_locked(self, force_refresh: bool) -> tuple[list[str], str | None]:
+        """Cache-first load (unless forced). Caller holds _refresh_lock."""
+        if not force_refresh:
+            df_tasks, df_site = load_latest_cache()
+            if df_tasks is not None and df_site is not None and not df_tasks.empty:
+                ts = get_cache_timestamp()
+                warnings = [f"Loaded from cache ({ts})"]
+                df_tasks, df_site, source_state = roll_business_date(
+                    df_tasks, df_site, load_source_state()
+                )
+                self._publish(df_tasks, df_site, warnings, source_state=source_state)
+                return warnings, None
+
+        return self._refresh_from_sources(force_refresh)
+
+    def _refresh_from_sources(
+        self, force_refresh: bool, background: bool = False
+    ) -> tuple[list[str], str | None]:
+        """
+        Fetch sources and rebuild changed packages, then publish a new
+        generation. Caller holds _refresh_lock. Returns (warnings, error) where
+        error is set when no source could be loaded.
+        """
+        base = self._generation
+        warnings: list[str] = []
+
+        # Only packages whose sheet changed are re-cleaned
+        parts = base.parts or split_parts(base.df_tasks, base.df_site)
+        source_state = base.source_state if base.source_state is not None else load_source_state()
+        parts, source_state, report = refresh_parts(parts, source_state)
+        succeeded, failed = report["succeeded"], report["failed"]
+        self.fetch_timings = report["timings"]
+
+        if failed:
+            warnings.append(f"Failed to load: {', '.join(failed)}")
+
+        if not succeeded:
+            if not base.df_tasks.empty:
+                # Keep serving what we have
+                warnings.append(f"All sources unavailable — cached data from {base.cache_ts}")
+                self._set_warnings(warnings)
+                return warnings, "All sources unavailable"
+            # Fallback to cache
+            df_tasks, df_site = load_latest_cache()
+            if df_tasks is not None and df_site is not None:
+                ts = get_cache_timestamp()
+                warnings.append(f"All sources unavailable — cached data from {ts}")
+                df_tasks, df_site, source_state = roll_business_date(
+                    df_tasks, df_site, load_source_state()
+                )
+                self._publish(df_tasks, df_site, warnings, source_state=source_state)
+            else:
+                warnings.append("No data available — check network and try again")
+                self._set_warnings(warnings)
+            return warnings, "All sources unavailable"
+
+        if background and self._pinned:
+            logger.info("Store pinned by rollback — discarding background refresh")
+            return self.warnings, None
+
+        df_tasks, df_site = assemble_parts(parts)
+
+        # Persist
+        save_latest_cache(
+            df_tasks, df_site, source_state, time.perf_counter() - self._refresh_started
+        )
+        save_source_state(source_state)
 
-            warnings.insert(0, f"Loaded {len(succeeded)}/{10} sources successfully")
-            self._set_data(df_tasks, df_site, warnings)
+        if force_refresh:
+            save_snapshot(df_site, source_state)
+            Thread(target=cleanup_old_snapshots, name="snapshot-retention", daemon=True).start()
+
+        if report["unchanged"]:
+            warnings.append(f"{len(report['unchanged'])} unchanged sources reused")
+        warnings.insert(0, f"Loaded {len(succeeded)}/{10} sources successfully")
+        self._publish(df_tasks, df_site, warnings, parts, source_state)
+        return warnings, None
+
+    def refresh_package(self, package_name: str) -> list[str]:
+        """
+        Refresh a single source and splice its rows into df_tasks, df_site,
+        df_pkg and df_dist without rebuilding the other packages.
+        Returns warnings list.
+        """
+        with self._refresh_lock, self._exclusive():
+            base = self._generation
+            parts = base.parts or split_parts(base.df_tasks, base.df_site)
+            if not parts:
+                # Nothing to splice into (cold start or unsplittable cache)
+                logger.info("No per-package parts available — running full refresh")
+                return self.load(force_refresh=True)
+
+            self._try_begin_refresh(f"package:{package_name}", background=False)
+            self._pinned = False
+            try:
+                warnings, error = self._refresh_package_locked(package_name, base, parts)
+            except Exception as exc:
+                self._end_refresh(str(exc))
+                raise
+            self._end_refresh(error)
             return warnings
 
-    def _set_data(self, df_tasks: pd.DataFrame, df_site: pd.DataFrame, warnings: list[str]):
-        self.df_tasks = df_tasks
-        self.df_site = df_site
-        
-        # Extract package-level metadata
-        df_pkg_meta = extract_package_metadata(df_tasks) if not df_tasks.empty else pd.DataFrame()
-        
-        # Build package summary with metadata
-        self.df_pkg = build_package_summary(df_site, df_pkg_meta) if not df_site.empty else pd.DataFrame()
-        self.df_dist = build_district_summary(df_site) if not df_site.empty else pd.DataFrame()
-        
-        self.warnings = warnings
-        self._last_refresh = time.time()
-        self._cache_ts = get_cache_timestamp()
-
-    def get_snapshots(self) -> pd.DataFrame:
-        return load_all_snapshots()
+    def _refresh_package_locked(
+        self, package_name: str, base: DataGeneration, parts: dict
+    ) -> tuple[list[str], str | None]:
+        """Fetch one package and splice it in. Caller holds _refresh_lock."""
+        source_state = base.source_state if base.source_state is not None else load_source_state()
+        parts, source_state, report = refresh_parts(
+            parts, source_state, names=[package_name]
+        )
+        self.fetch_timings = report["timings"]
+
+        if report["failed"]:
+            warnings = [f"Failed to load: {package_name}"]
+            self._set_warnings(warnings)
+            return warnings, f"Failed to load {package_name}"
+        if report["unchanged"] and not report["rolled"]:
+            warnings = [f"{package_name} unchanged since last refresh"]
+            self._set_warnings(warnings)
+            return warnings, None
+
+        df_tasks, df_site = assemble_parts(parts)
+        if report["rolled"]:
+            # Other packages moved to a new business date: rebuild Layer C in full
+            df_pkg = df_dist = None
+        else:
+            pkg_tasks, pkg_site = parts[package_name]
+            replaced = set(pkg_tasks["package_name"].dropna()) | {package_name}
+            df_pkg = self._splice_package_rows(
+                base.df_pkg,
+                build_package_summary(pkg_site, extract_package_metadata(pkg_tasks)),
+                replaced,
+            )
+            df_dist = self._splice_package_rows(
+                base.df_dist, build_district_summary(pkg_site), replaced
+            )
+
+        save_latest_cache(
+            df_tasks, df_site, source_state, time.perf_counter() - self._refresh_started
+        )
+        save_source_state(source_state)
+
+        if report["unchanged"]:
+            warnings = [f"{package_name} unchanged since last refresh"]
+        else:
+            warnings = [f"Refreshed {package_name}"]
+        self._publish(df_tasks, df_site, warnings, parts, source_state, df_pkg, df_dist)
+        return warnings, None
+
+    @staticmethod
+    def _splice_package_rows(
+        df: pd.DataFrame, new_rows: pd.DataFrame, package_names: set[str]
+    ) -> pd.DataFrame:
+        """Replace the rows of the given packages, keeping groupby (package_name) order."""
+        if df.empty:
+            return new_rows
+        kept = df[~df["package_name"].isin(package_names)]
+        return (
+            concat_frames([kept, new_rows], ignore_index=True)
+            .sort_values("package_name", kind="stable")
+            .reset_index(drop=True)
+        )
+
+    # ------------------------------------------------------------------
+    # Shared data plane (multi-worker)
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def _exclusive(self, blocking: bool = True):
+        """
+        Hold the cross-worker refresh lock, then adopt whatever another worker
+        published before we got it. Yields whether the lock was acquired.
+        Caller holds _refresh_lock (lock order: _refresh_lock, then flock).
+        No-op without a shared plane.
+        """
+        if self._plane is None:
+            yield True
+            return
+        with self._plane.exclusive(blocking) as acquired:
+            if acquired:
+                self._adopt_shared(self._plane.poll(force=True))
+            yield acquired
+
+    def sync_shared(self) -> bool:
+        """
+        Switch to a newer shared generation if one was published (polled at
+        most every SHARED_POLL_SECONDS). Never waits on a lock: while this
+        worker's own refresh holds it, that refresh adopts the generation
+        instead. Mapping and publishing run on the calling thread (the
+        middleware calls this through refresh_if_stale in the threadpool).
+        Returns True if a generation was adopted.
+        """
+        if self._plane is None:
+            return False
+        manifest = self._plane.poll()
+        if manifest is None or not self._refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            return self._adopt_shared(manifest)
+        finally:
+            self._refresh_lock.release()
+
+    def _adopt_shared(self, manifest: dict | None) -> bool:
+        """Publish a shared generation locally. Caller holds _refresh_lock."""
+        if manifest is None:
+            return False
+        try:
+            frames = self._plane.load(manifest)
+        except Exception as exc:
+            # Pruned while we lagged behind: the next poll picks up the newest
+            logger.warning("Failed to map shared generation %d: %s", manifest["generation"], exc)
+            return False
+        self._publish(
+            frames["df_tasks"], frames["df_site"], manifest["warnings"], None,
+            manifest["source_state"], frames["df_pkg"], frames["df_dist"],
+            refreshed=False, share=False, business_date=manifest["business_date"],
+        )
+        self._last_refresh = manifest["refreshed_at"]
+        self._pinned = manifest["pinned"]
+        logger.info("Adopted shared generation %d", manifest["generation"])
+        return True
+
+    def _share(self, gen: DataGeneration):
+        """Publish a generation to the other workers. Caller holds the flock."""
+        if self._plane is None or gen.df_tasks.empty:
+            return
+        try:
+            self._plane.publish(
+                {
+                    "df_tasks": gen.df_tasks,
+                    "df_site": gen.df_site,
+                    "df_pkg": gen.df_pkg,
+                    "df_dist": gen.df_dist,
+                },
+                warnings=list(gen.warnings),
+                business_date=gen.business_date,
+                source_state=gen.source_state,
+                pinned=self._pinned,
+                refreshed_at=self._last_refresh,
+            )
+        except Exception as exc:
+            # This worker keeps serving it; the others refresh on their own TTL
+            logger.warning("Failed to publish shared generation: %s", exc)
+
+    # ------------------------------------------------------------------
+    # Publication & rollback
+    # ------------------------------------------------------------------
+
+    def _set_warnings(self, warnings: list[str]):
+        """Replace warnings on the current generation (frames unchanged)."""
+        with self._data_lock:
+            self._generation = replace(self._generation, warnings=tuple(warnings))
+
+    def _publish(
+        self,
+        df_tasks: pd.DataFrame,
+        df_site: pd.DataFrame,
+        warnings: list[str],
+        parts: dict[str, tuple[pd.DataFrame, pd.DataFrame]] | None = None,
+        source_state: dict | None = None,
+        df_pkg: pd.DataFrame | None = None,
+        df_dist: pd.DataFrame | None = None,
+        refreshed: bool = True,
+        share: bool = True,
+        business_date: str | None = None,
+    ) -> DataGeneration:
+        """
+        Build Layer C (unless given) and publish a new generation with one swap.
+        refreshed=False (business-date roll) leaves the staleness clock alone;
+        share=False (adopted from another worker) skips the shared plane.
+        """
+        if df_pkg is None:
+            # Extract package-level metadata
+            df_pkg_meta = extract_package_metadata(df_tasks) if not df_tasks.empty else pd.DataFrame()
+            # Build package summary with metadata
+            df_pkg = build_package_summary(df_site, df_pkg_meta) if not df_site.empty else pd.DataFrame()
+        if df_dist is None:
+            df_dist = build_district_summary(df_site) if not df_site.empty else pd.DataFrame()
+
+        cache_ts = get_cache_timestamp()
+        with self._data_lock:
+            generation = DataGeneration(
+                id=self._next_id,
+                df_tasks=df_tasks,
+                df_site=df_site,
+                df_pkg=df_pkg,
+                df_dist=df_dist,
+                warnings=tuple(warnings),
+                cache_ts=cache_ts,
+                created_at=datetime.now().isoformat(timespec="seconds"),
+                business_date=business_date or str(_get_today().date()),
+                # Parts are re-split lazily from the frames when loaded from cache
+                parts=parts or {},
+                source_state=source_state,
+            )
+            self._next_id += 1
+            self._generation = generation
+            self._history.append(generation)
+            if refreshed:
+                self._last_refresh = time.time()
+        if share:
+            self._share(generation)
+            self._record_changes(generation)
+        return generation
+
+    def _record_changes(self, gen: DataGeneration):
+        """
+        Append the task changes of a locally built generation to the change
+        log, off the calling thread (hashing every task takes a while).
+        """
+        self._change_log.submit(self._record_changes_now, gen)
+
+    @staticmethod
+    def _record_changes_now(gen: DataGeneration):
+        try:
+            record_changes(gen.df_tasks)
+        except Exception as exc:
+            logger.warning("Failed to record task changes of generation %d: %s", gen.id, exc)
+
+    def rollback(self, generation_id: int | None = None) -> DataGeneration | None:
+        """
+        Re-publish an earlier in-memory generation (default: the one before
+        the current). Background revalidation is paused until the next
+        explicit refresh so the bad sheet is not fetched straight back.
+        Returns the generation now current, or None if not found.
+        """
+        with self._data_lock:
+            current = self._generation
+            if generation_id is None:
+                older = [g for g in self._history if g.id < current.id]
+                target = older[-1] if older else None
+            else:
+                target = next((g for g in self._history if g.id == generation_id), None)
+            if target is None:
+                return None
+            self._generation = target
+            self._pinned = True
+
+        logger.info("Rolled back from generation %d to %d", current.id, target.id)
+        if self._plane is not None:
+            # Other workers adopt the rolled-back frames and the pin with them
+            with self._refresh_lock, self._plane.exclusive():
+                self._share(target)
+        self._record_changes(target)
+        # Persist so a restart (and the next refresh's hash checks) match the rollback
+        if not target.df_tasks.empty:
+            save_latest_cache(target.df_tasks, target.df_site, target.source_state)
+        # Unknown hashes → empty state, so the next refresh refetches everything
+        save_source_state(target.source_state or {})
+        return target
+
+    def generation_as_of(self, as_of: datetime | None = None) -> DataGeneration | None:
+        """
+        The current generation, or with as_of one rebuilt from the newest
+        snapshot taken at or before as_of (None if there is none). Snapshots
+        hold df_site only: df_tasks is empty and the task-derived package
+        metadata columns (mobilization, compliance, IPC) are null, since that
+        point in time did not record them.
+        """
+        if as_of is None:
+            return self._generation
+        ts = find_snapshot(as_of)
+        if ts is None:
+            return None
+        with self._as_of_lock:
+            if ts in self._as_of_cache:
+                self._as_of_cache.move_to_end(ts)
+                return self._as_of_cache[ts]
+
+        # Under the snapshot lock: a frame cut short by compaction would stay cached
+        df_site = load_all_snapshots(start=ts, end=ts, consistent=True).drop(
+            columns="_snapshot_ts", errors="ignore"
+        )
+        current = self._generation
+        df_pkg = build_package_summary(df_site) if not df_site.empty else pd.DataFrame()
+        if not df_pkg.empty:
+            # Same columns as a live df_pkg, with the metadata left null
+            df_pkg = df_pkg.reindex(columns=df_pkg.columns.union(current.df_pkg.columns, sort=False))
+        generation = DataGeneration(
+            id=0,
+            df_tasks=current.df_tasks.iloc[0:0],
+            df_site=df_site,
+            df_pkg=df_pkg,
+            df_dist=build_district_summary(df_site) if not df_site.empty else pd.DataFrame(),
+            cache_ts=ts.isoformat(sep=" ", timespec="seconds"),
+            created_at=datetime.now().isoformat(timespec="seconds"),
+            business_date=str(ts.date()),
+        )
+        with self._as_of_lock:
+            self._as_of_cache[ts] = generation
+            self._as_of_cache.move_to_end(ts)
+            while len(self._as_of_cache) > AS_OF_CACHE_SIZE:
+                self._as_of_cache.popitem(last=False)
+        return generation
+
+    def get_snapshots(self, columns: list[str] | None = None, **filters) -> pd.DataFrame:
+        return load_all_snapshots(columns, **filters)
+
+    def get_site_history(self, site: tuple, **filters) -> pd.DataFrame:
+        return load_site_history(site, **filters)
+
+    def get_snapshot_diff(
+        self, start: datetime | None = None, end: datetime | None = None, columns: list[str] | None = None,
+    ):
+        return load_snapshot_diff(start, end, columns)
+
+    def get_task_changes(self, since: int = 0):
+        return read_changes(since)
+
+    def get_trend_rollup(self, level: str = "global", **filters) -> pd.DataFrame:
+        return load_trend_rollup(level, **filters)
 
 
 # Module-level singleton
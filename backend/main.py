@@ -11,7 +11,8 @@ import logging
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 
 from backend.data_store import store
@@ -53,6 +54,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def revalidate_stale_data(request: Request, call_next):
+    """
+    Start a background refresh once the TTL expires. The business-date roll
+    and shared-generation adoption that may run first (see refresh_if_stale)
+    run in the threadpool, so they never block the event loop.
+    """
+    await run_in_threadpool(store.refresh_if_stale)
+    return await call_next(request)
+
+
 # Mount routers
 app.include_router(data_router, prefix="/api/data", tags=["Data"])
 app.include_router(filters_router, prefix="/api/filters", tags=["Filters"])
@@ -64,9 +76,11 @@ app.include_router(risk_router, prefix="/api/risk", tags=["Risk"])
 
 @app.get("/api/health")
 def health_check():
+    gen = store.generation
     return {
         "status": "ok",
-        "rows_tasks": len(store.df_tasks),
-        "rows_sites": len(store.df_site),
-        "cache_timestamp": store.cache_timestamp,
+        "rows_tasks": len(gen.df_tasks),
+        "rows_sites": len(gen.df_site),
+        "cache_timestamp": gen.cache_ts,
+        "refresh": store.refresh_status,
     }
@@ -2,9 +2,12 @@
 data_router.py — Core data endpoints: refresh, summary stats, raw data.
 """
 
-from fastapi import APIRouter, Query
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException, Query
+from config import CSV_SOURCES, SITE_KEY, SNAPSHOT_DIFF_COLUMNS
 from backend.data_store import store
-from backend.utils import df_to_records, filter_df
+from backend.utils import df_to_records, filter_df, generation_as_of, safe_json
 
 router = APIRouter()
 
@@ -13,32 +16,70 @@ router = APIRouter()
 def refresh_data():
     """Force a fresh data load from Google Sheets."""
     warnings = store.load(force_refresh=True)
+    gen = store.generation
+    return {
+        "status": "refreshed",
+        "warnings": warnings,
+        "generation": gen.id,
+        "rows_tasks": len(gen.df_tasks),
+        "rows_sites": len(gen.df_site),
+        "timings": store.fetch_timings,
+    }
+
+
+@router.post("/refresh/{package_name}")
+def refresh_package(package_name: str):
+    """Re-fetch a single package and splice it into the current data."""
+    if package_name not in CSV_SOURCES:
+        raise HTTPException(status_code=404, detail=f"Unknown package: {package_name}")
+    warnings = store.refresh_package(package_name)
+    gen = store.generation
     return {
         "status": "refreshed",
+        "package_name": package_name,
         "warnings": warnings,
-        "rows_tasks": len(store.df_tasks),
-        "rows_sites": len(store.df_site),
+        "generation": gen.id,
+        "rows_tasks": len(gen.df_tasks),
+        "rows_sites": len(gen.df_site),
+        "timings": store.fetch_timings,
     }
 
 
+@router.get("/generations")
+def list_generations():
+    """In-memory data generations available for rollback."""
+    return {"current": store.generation.id, "generations": store.generations}
+
+
+@router.post("/rollback")
+def rollback(generation: int | None = Query(None)):
+    """Revert to an earlier in-memory generation (default: the previous one) without refetching."""
+    gen = store.rollback(generation)
+    if gen is None:
+        raise HTTPException(status_code=404, detail="No such generation to roll back to")
+    return {"status": "rolled_back", **gen.summary()}
+
+
 @router.get("/summary")
 def global_summary():
     """High-level KPIs across all packages."""
-    df = store.df_site
+    gen = store.generation
+    df = gen.df_site
     if df.empty:
         return {"total_sites": 0, "total_tasks": 0}
 
     return {
         "total_sites": len(df),
-        "total_tasks": len(store.df_tasks),
+        "total_tasks": len(gen.df_tasks),
         "active_sites": int((df["site_status"] == "Active").sum()),
         "completed_sites": int((df["site_status"] == "Completed").sum()),
         "inactive_sites": int((df["site_status"] == "Inactive").sum()),
         "avg_progress": round(float(df["site_progress"].mean()), 1),
         "sites_gt30_delayed": int((df["site_delay_days"] > 30).sum()),
         "sites_gt60_delayed": int((df["site_delay_days"] > 60).sum()),
-        "cache_timestamp": store.cache_timestamp,
-        "warnings": store.warnings,
+        "cache_timestamp": gen.cache_ts,
+        "warnings": list(gen.warnings),
+        "generation": gen.id,
     }
 
 
@@ -47,12 +88,63 @@ def get_sites(
     package_name: str | None = Query(None),
     district: str | None = Query(None),
     status: str | None = Query(None),
+    as_of: datetime | None = Query(None),
 ):
-    """Return site-level data with optional filters."""
-    df = filter_df(store.df_site, package_name=package_name, district=district, status=status)
+    """Return site-level data with optional filters, optionally as of a past snapshot."""
+    df = filter_df(
+        generation_as_of(as_of).df_site, package_name=package_name, district=district, status=status
+    )
     return df_to_records(df)
 
 
+@router.get("/diff")
+def snapshot_diff(
+    from_: datetime | None = Query(None, alias="from"),
+    to: datetime | None = Query(None),
+    columns: list[str] = Query(SNAPSHOT_DIFF_COLUMNS),
+):
+    """
+    Sites that changed between the snapshots in effect at `from` and `to`
+    (default: the last two) in any of `columns` (repeatable; default
+    SNAPSHOT_DIFF_COLUMNS), with only the columns that changed.
+    """
+    result = store.get_snapshot_diff(from_, to, columns)
+    if result is None:
+        raise HTTPException(status_code=404, detail="No snapshots to compare")
+    from_ts, to_ts, changes = result
+
+    sites: dict[tuple, dict] = {}
+    for change, *key, column, old, new in zip(*(changes[c] for c in changes.columns)):
+        site = sites.setdefault(
+            tuple(key), {**{k: safe_json(v) for k, v in zip(SITE_KEY, key)}, "change": change, "columns": {}}
+        )
+        if change == "changed":
+            site["columns"][column] = {"from": safe_json(old), "to": safe_json(new)}
+    counts = {c: sum(s["change"] == c for s in sites.values()) for c in ("changed", "added", "removed")}
+    return {
+        "from": from_ts.isoformat(),
+        "to": to_ts.isoformat(),
+        **counts,
+        "sites": list(sites.values()),
+    }
+
+
+@router.get("/changes")
+def task_changes(since: int = Query(0, ge=0)):
+    """
+    Inserted, updated and deleted tasks of every change-log generation after
+    `since`. Pass the returned generation as `since` on the next call.
+    """
+    result = store.get_task_changes(since)
+    if result is None:
+        raise HTTPException(
+            status_code=410,
+            detail=f"Changes after generation {since} are no longer kept — resync from /api/data/tasks",
+        )
+    generation, changes = result
+    return {"since": since, "generation": generation, "changes": df_to_records(changes)}
+
+
 @router.get("/tasks")
 def get_tasks(
     package_name: str | None = Query(None),
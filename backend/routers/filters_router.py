@@ -11,9 +11,10 @@ router = APIRouter()
 @router.get("/packages")
 def list_packages():
     """Return distinct package names."""
-    if store.df_site.empty:
+    df = store.df_site
+    if df.empty:
         return []
-    return sorted(store.df_site["package_name"].dropna().unique().tolist())
+    return sorted(df["package_name"].dropna().unique().tolist())
 
 
 @router.get("/districts")
@@ -46,6 +47,7 @@ def list_sites(
 @router.get("/statuses")
 def list_statuses():
     """Return distinct site statuses."""
-    if store.df_site.empty:
+    df = store.df_site
+    if df.empty:
         return []
-    return sorted(store.df_site["site_status"].dropna().unique().tolist())
+    return sorted(df["site_status"].dropna().unique().tolist())
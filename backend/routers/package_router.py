@@ -3,26 +3,28 @@ package_router.py — Package-level endpoints.
 Package summary table, district drill-down, per-package charts.
 """
 
+from datetime import datetime
+
 from fastapi import APIRouter, Query
-from backend.data_store import store
-from backend.utils import df_to_records, filter_df
+from backend.utils import df_to_records, filter_df, generation_as_of
 
 router = APIRouter()
 
 
 @router.get("/")
-def list_packages():
+def list_packages(as_of: datetime | None = Query(None)):
     """Package summary table with all aggregated metrics."""
-    df = store.df_pkg
+    df = generation_as_of(as_of).df_pkg
     if df.empty:
         return []
     return df_to_records(df)
 
 
 @router.get("/{package_name}")
-def package_detail(package_name: str):
+def package_detail(package_name: str, as_of: datetime | None = Query(None)):
     """Detailed data for a specific package."""
-    df_pkg = store.df_pkg
+    gen = generation_as_of(as_of)
+    df_pkg = gen.df_pkg
     if df_pkg.empty:
         return {"package": None, "districts": [], "sites": []}
 
@@ -30,14 +32,14 @@ def package_detail(package_name: str):
     pkg_data = df_to_records(pkg_row)[0] if not pkg_row.empty else None
 
     # District breakdown within this package
-    df_dist = store.df_dist
+    df_dist = gen.df_dist
     districts = df_to_records(
         df_dist[df_dist["package_name"] == package_name]
     ) if not df_dist.empty else []
 
     # Sites within this package
     sites = df_to_records(
-        filter_df(store.df_site, package_name=package_name)
+        filter_df(gen.df_site, package_name=package_name)
     )
 
     return {
@@ -48,25 +50,30 @@ def package_detail(package_name: str):
 
 
 @router.get("/{package_name}/districts")
-def package_districts(package_name: str):
+def package_districts(package_name: str, as_of: datetime | None = Query(None)):
     """District-level summary within a package."""
-    df = store.df_dist
+    df = generation_as_of(as_of).df_dist
     if df.empty:
         return []
     return df_to_records(df[df["package_name"] == package_name])
 
 
 @router.get("/{package_name}/sites")
-def package_sites(package_name: str, district: str | None = Query(None)):
+def package_sites(
+    package_name: str,
+    district: str | None = Query(None),
+    as_of: datetime | None = Query(None),
+):
     """All sites within a package, optionally filtered by district."""
-    df = filter_df(store.df_site, package_name=package_name, district=district)
+    df = filter_df(generation_as_of(as_of).df_site, package_name=package_name, district=district)
     return df_to_records(df)
 
 
 @router.get("/{package_name}/delay-chart")
-def package_delay_chart(package_name: str):
+def package_delay_chart(package_name: str, as_of: datetime | None = Query(None)):
     """Delay distribution for a specific package."""
-    df = store.df_site[store.df_site["package_name"] == package_name] if not store.df_site.empty else store.df_site
+    df_site = generation_as_of(as_of).df_site
+    df = df_site[df_site["package_name"] == package_name] if not df_site.empty else df_site
     if df.empty:
         return []
     counts = df["delay_bucket"].value_counts()
@@ -1,16 +1,28 @@
 """
 risk_router.py — Risk & Recovery endpoints.
-Risk score distribution, recovery recommendations, trends.
+Risk score distribution, recovery recommendations, trends, what-if scoring.
 """
 
 import numpy as np
 import pandas as pd
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel
+
+from config import DELAY_BUCKET_CUTOFFS, MOBILIZATION_PENALTY, PROGRESS_SCORE_BRACKETS
+from transform import delay_bucket_labels, mobilized_sites, score_sites
 from backend.data_store import store
 from backend.utils import df_to_records, filter_df
 
 router = APIRouter()
 
+RISK_BRACKETS = [
+    (0, 20, "Low (0-20)"),
+    (20, 40, "Medium-Low (20-40)"),
+    (40, 60, "Medium (40-60)"),
+    (60, 80, "Medium-High (60-80)"),
+    (80, 200, "High (80+)"),
+]
+
 
 @router.get("/scores")
 def risk_scores(
@@ -40,15 +52,8 @@ def risk_distribution(package_name: str | None = Query(None)):
     if df.empty:
         return []
 
-    brackets = [
-        (0, 20, "Low (0-20)"),
-        (20, 40, "Medium-Low (20-40)"),
-        (40, 60, "Medium (40-60)"),
-        (60, 80, "Medium-High (60-80)"),
-        (80, 200, "High (80+)"),
-    ]
     result = []
-    for lo, hi, label in brackets:
+    for lo, hi, label in RISK_BRACKETS:
         count = int(((df["risk_score"] >= lo) & (df["risk_score"] < hi)).sum())
         result.append({"bracket": label, "min": lo, "max": hi, "count": count})
     return result
@@ -78,27 +83,111 @@ def recovery_candidates(
     return df_to_records(candidates[available])
 
 
-@router.get("/trends")
-def risk_trends():
-    """Historical risk score trends from snapshots."""
-    snapshots = store.get_snapshots()
-    if snapshots.empty:
-        return []
+class WhatIfWeights(BaseModel):
+    """
+    Alternative §9.3 / §9.7 scoring parameters; omitted ones keep config
+    values. That includes mobilization_penalty (MOBILIZATION_PENALTY), which
+    the stored risk_score does not apply yet, so send 0 to compare like with
+    like.
+    """
+    delay_bucket_cutoffs: list[float] | None = None
+    delay_score_map: dict[str, float] | None = None
+    progress_score_brackets: list[tuple[float, float, float]] | None = None
+    mobilization_penalty: float | None = None
+
 
-    if "_snapshot_ts" not in snapshots.columns:
+@router.post("/what-if")
+def risk_what_if(
+    weights: WhatIfWeights,
+    package_name: str | None = Query(None),
+    district: str | None = Query(None),
+    limit: int = Query(50, ge=1),
+):
+    """
+    Re-score sites with alternative weights without touching the stored
+    generation. Returns the top sites re-ranked (with their current score
+    and rank) and risk bracket counts before and after.
+    """
+    cutoffs = weights.delay_bucket_cutoffs or DELAY_BUCKET_CUTOFFS
+    if any(lo >= hi for lo, hi in zip(cutoffs, cutoffs[1:])):
+        raise HTTPException(status_code=422, detail="delay_bucket_cutoffs must be increasing")
+    labels = delay_bucket_labels(cutoffs)
+    if weights.delay_score_map is not None and set(weights.delay_score_map) != set(labels):
+        raise HTTPException(status_code=422, detail=f"delay_score_map must have the keys {labels}")
+    if weights.delay_score_map is None and weights.delay_bucket_cutoffs and len(cutoffs) != len(DELAY_BUCKET_CUTOFFS):
+        raise HTTPException(status_code=422, detail="delay_score_map is required for a different number of buckets")
+    brackets = weights.progress_score_brackets or PROGRESS_SCORE_BRACKETS
+    if any(lo >= hi for lo, hi, _ in brackets):
+        raise HTTPException(status_code=422, detail="progress_score_brackets need lo < hi")
+
+    gen = store.generation
+    df = filter_df(gen.df_site, package_name=package_name, district=district)
+    if df.empty:
+        return {"sites": [], "brackets": [], "delay_buckets": []}
+
+    scores = score_sites(
+        df,
+        delay_bucket_cutoffs=cutoffs,
+        delay_score_map=weights.delay_score_map,
+        progress_score_brackets=brackets,
+        mobilization_penalty=(
+            MOBILIZATION_PENALTY if weights.mobilization_penalty is None else weights.mobilization_penalty
+        ),
+        mobilized=mobilized_sites(df, gen.df_pkg),
+    )
+    baseline = df["risk_score"]
+    rank = scores["risk_score"].rank(method="min", ascending=False).to_numpy(dtype=int)
+    baseline_rank = baseline.rank(method="min", ascending=False).to_numpy(dtype=int)
+    top = np.lexsort((baseline_rank, rank))[:limit]
+    result = pd.concat([
+        df[["package_name", "district", "site_name", "site_progress",
+            "site_delay_days", "site_status"]].iloc[top],
+        scores.iloc[top],
+    ], axis=1)
+    result["baseline_risk_score"] = baseline.to_numpy()[top]
+    result["rank"] = rank[top]
+    result["baseline_rank"] = baseline_rank[top]
+    result["rank_change"] = baseline_rank[top] - rank[top]
+
+    # Alternative weights can leave the 0-200 range: the outer brackets are open-ended
+    edges = [lo for lo, _, _ in RISK_BRACKETS[1:]]
+    counts = np.bincount(np.digitize(scores["risk_score"], edges), minlength=len(RISK_BRACKETS))
+    baseline_counts = np.bincount(np.digitize(baseline, edges), minlength=len(RISK_BRACKETS))
+    bucket_counts = scores["delay_bucket"].value_counts()
+    return {
+        "sites": df_to_records(result),
+        "brackets": [
+            {"bracket": label, "min": lo, "max": hi,
+             "count": int(count), "baseline_count": int(baseline_count)}
+            for (lo, hi, label), count, baseline_count in zip(RISK_BRACKETS, counts, baseline_counts)
+        ],
+        "delay_buckets": [
+            {"bucket": label, "count": int(bucket_counts.get(label, 0))} for label in labels
+        ],
+    }
+
+
+@router.get("/trends")
+def risk_trends(package_name: str | None = Query(None)):
+    """Historical risk score trends from the per-snapshot rollups."""
+    if package_name:
+        rollup = store.get_trend_rollup("package", packages=[package_name])
+    else:
+        rollup = store.get_trend_rollup("global")
+    if rollup.empty:
         return []
 
-    # Aggregate by snapshot timestamp
-    grp = snapshots.groupby("_snapshot_ts")
     result = []
-    for ts, group in grp:
+    for ts, progress, risk, sites in zip(
+        rollup["_snapshot_ts"], rollup["avg_progress"], rollup["avg_risk_score"], rollup["total_sites"]
+    ):
         result.append({
-            "timestamp": ts.isoformat() if hasattr(ts, "isoformat") else str(ts),
-            "avg_progress": round(float(group["site_progress"].mean()), 1) if "site_progress" in group.columns else 0,
-            "avg_risk_score": round(float(group["risk_score"].mean()), 1) if "risk_score" in group.columns else 0,
-            "total_sites": len(group),
+            "timestamp": ts.isoformat(),
+            "avg_progress": round(float(progress), 1) if pd.notna(progress) else 0,
+            "avg_risk_score": round(float(risk), 1) if pd.notna(risk) else 0,
+            "total_sites": int(sites),
         })
-    return sorted(result, key=lambda x: x["timestamp"])
+    return result
 
 
 @router.get("/actual-vs-planned")
@@ -110,8 +199,9 @@ def actual_vs_planned(package_name: str | None = Query(None)):
                        across all tasks with valid dates, clipped to [0, 100].
     actual_progress  = avg site_progress across all sites in the package.
     """
-    df_tasks = store.df_tasks
-    df_site = store.df_site
+    gen = store.generation
+    df_tasks = gen.df_tasks
+    df_site = gen.df_site
 
     if df_tasks.empty or df_site.empty:
         return []
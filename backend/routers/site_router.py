@@ -1,8 +1,10 @@
 """
 site_router.py — Site Command Center endpoints.
-Site-level detail, tasks, IPC status, photos.
+Site-level detail, tasks, IPC status, photos, snapshot history.
 """
 
+from datetime import datetime
+
 from fastapi import APIRouter, Query
 from backend.data_store import store
 from backend.utils import df_to_records
@@ -17,16 +19,7 @@ def site_detail(
     site_name: str = Query(...),
 ):
     """Full site detail by composite key."""
-    df = store.df_site
-    if df.empty:
-        return None
-
-    mask = (
-        (df["package_name"] == package_name)
-        & (df["district"] == district)
-        & (df["site_name"] == site_name)
-    )
-    row = df[mask]
+    row = store.generation.site_row(package_name, district, site_name)
     if row.empty:
         return None
 
@@ -40,17 +33,10 @@ def site_tasks(
     site_name: str = Query(...),
 ):
     """All tasks for a specific site."""
-    df = store.df_tasks
-    if df.empty:
+    tasks = store.generation.site_tasks(package_name, district, site_name)
+    if tasks.empty:
         return []
 
-    mask = (
-        (df["package_name"] == package_name)
-        & (df["district"] == district)
-        & (df["site_name"] == site_name)
-    )
-    tasks = df[mask]
-
     cols = [
         "discipline", "task_name", "planned_start", "planned_finish",
         "actual_start", "actual_finish", "planned_duration_days",
@@ -68,16 +54,7 @@ def site_ipc(
     site_name: str = Query(...),
 ):
     """IPC status for a specific site."""
-    df = store.df_site
-    if df.empty:
-        return {}
-
-    mask = (
-        (df["package_name"] == package_name)
-        & (df["district"] == district)
-        & (df["site_name"] == site_name)
-    )
-    row = df[mask]
+    row = store.generation.site_row(package_name, district, site_name)
     if row.empty:
         return {}
 
@@ -97,17 +74,10 @@ def site_photos(
     site_name: str = Query(...),
 ):
     """Before/after photo URLs for tasks at a specific site."""
-    df = store.df_tasks
-    if df.empty:
+    tasks = store.generation.site_tasks(package_name, district, site_name)
+    if tasks.empty:
         return []
 
-    mask = (
-        (df["package_name"] == package_name)
-        & (df["district"] == district)
-        & (df["site_name"] == site_name)
-    )
-    tasks = df[mask]
-
     photo_cols = [
         "before_photo_share_url", "before_photo_direct_url",
         "after_photo_share_url", "after_photo_direct_url",
@@ -127,3 +97,19 @@ def site_photos(
         if has_photo:
             result.append(entry)
     return result
+
+
+@router.get("/history")
+def site_history(
+    package_name: str = Query(...),
+    district: str | None = Query(None),
+    site_name: str = Query(...),
+    start: datetime | None = Query(None),
+    end: datetime | None = Query(None),
+):
+    """
+    Progress, delay, risk and status of one site at each stored snapshot.
+    Omit district (or leave it empty) for sites without one.
+    """
+    df = store.get_site_history((package_name, district or None, site_name), start=start, end=end)
+    return df_to_records(df)
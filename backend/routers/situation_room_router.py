@@ -3,17 +3,18 @@ situation_room_router.py — Situation Room page endpoints.
 Executive overview: KPIs, delay distribution, status breakdown, compliance.
 """
 
-from fastapi import APIRouter, Query
-from backend.data_store import store
-from backend.utils import df_to_records, filter_df
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException, Query
+from backend.utils import df_to_records, filter_df, generation_as_of
 
 router = APIRouter()
 
 
 @router.get("/kpis")
-def situation_kpis(package_name: str | None = Query(None)):
+def situation_kpis(package_name: str | None = Query(None), as_of: datetime | None = Query(None)):
     """Core KPIs for the situation room."""
-    df = store.df_site
+    df = generation_as_of(as_of).df_site
     if package_name:
         df = df[df["package_name"] == package_name]
     if df.empty:
@@ -38,9 +39,9 @@ def situation_kpis(package_name: str | None = Query(None)):
 
 
 @router.get("/delay-distribution")
-def delay_distribution(package_name: str | None = Query(None)):
+def delay_distribution(package_name: str | None = Query(None), as_of: datetime | None = Query(None)):
     """Delay bucket counts for bar/pie charts."""
-    df = store.df_site
+    df = generation_as_of(as_of).df_site
     if package_name:
         df = df[df["package_name"] == package_name]
     if df.empty:
@@ -58,22 +59,25 @@ def delay_distribution(package_name: str | None = Query(None)):
 
 
 @router.get("/status-breakdown")
-def status_breakdown(package_name: str | None = Query(None)):
+def status_breakdown(package_name: str | None = Query(None), as_of: datetime | None = Query(None)):
     """Site status counts for donut/pie chart."""
-    df = store.df_site
+    df = generation_as_of(as_of).df_site
     if package_name:
         df = df[df["package_name"] == package_name]
     if df.empty:
         return []
 
     counts = df["site_status"].value_counts()
-    return [{"status": k, "count": int(v)} for k, v in counts.items()]
+    return [{"status": k, "count": int(v)} for k, v in counts.items() if v > 0]
 
 
 @router.get("/compliance")
-def compliance_summary(package_name: str | None = Query(None)):
+def compliance_summary(package_name: str | None = Query(None), as_of: datetime | None = Query(None)):
     """Compliance rates for CESMPS, OHS, RFB (package-level)."""
-    df = store.df_pkg
+    if as_of is not None:
+        # Snapshots do not record package metadata (see generation_as_of)
+        raise HTTPException(status_code=404, detail="Compliance is not recorded in snapshots")
+    df = generation_as_of(as_of).df_pkg
     if package_name:
         df = df[df["package_name"] == package_name]
     if df.empty:
@@ -94,9 +98,9 @@ def compliance_summary(package_name: str | None = Query(None)):
 
 
 @router.get("/progress-by-package")
-def progress_by_package():
+def progress_by_package(as_of: datetime | None = Query(None)):
     """Average progress per package for the overview bar chart."""
-    df = store.df_pkg
+    df = generation_as_of(as_of).df_pkg
     if df.empty:
         return []
     return df_to_records(df[["package_name", "avg_progress", "total_sites",
@@ -104,9 +108,13 @@ def progress_by_package():
 
 
 @router.get("/red-list")
-def red_list(package_name: str | None = Query(None), limit: int = Query(20)):
+def red_list(
+    package_name: str | None = Query(None),
+    limit: int = Query(20),
+    as_of: datetime | None = Query(None),
+):
     """Sites needing immediate attention (high risk score)."""
-    df = store.df_site
+    df = generation_as_of(as_of).df_site
     if package_name:
         df = df[df["package_name"] == package_name]
     if df.empty:
@@ -0,0 +1,106 @@
+"""
+shared_plane.py — Shared-memory data plane for multi-worker deployments.
+
+With `uvicorn --workers N` every worker used to fetch, clean and hold its own
+copy of the frames. When SHARED_DATA_DIR points at tmpfs (e.g. /dev/shm/dashy)
+the workers instead share one set of Arrow generations:
+
+  - refreshes run under an flock on <dir>/refresh.lock, so only one worker at
+    a time fetches and builds (the others skip background refreshes while it
+    is held and wait on forced ones);
+  - the worker holding the lock publishes the finished generation with
+    loader.write_frame_generation (uncompressed Arrow IPC + manifest,
+    CURRENT swapped atomically);
+  - every worker polls CURRENT (a few bytes, at most every
+    SHARED_POLL_SECONDS) and memory-maps a newer generation read-only.
+
+Adopted frames point into the shared mapping rather than private copies
+for their numeric, timestamp and string columns. Each worker copies the
+codes of categorical columns (a byte or two per row) and all-null string
+columns. On recent pyarrow/pandas, codes without missing values are mapped
+too (see loader._read_cache_frame).
+
+The manifest carries the store state that must agree across workers
+(warnings, business date, source validators, rollback pin, refresh time).
+"""
+
+import os
+import sys
+import time
+import fcntl
+from contextlib import contextmanager
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from config import SHARED_POLL_SECONDS, CACHE_GENERATIONS_KEEP
+from loader import read_frame_manifest, read_frame_generation, write_frame_generation
+
+_LOCK_FILE = "refresh.lock"
+
+
+class SharedDataPlane:
+    """Arrow generations in a shared directory plus the cross-worker refresh lock."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock_fd: int | None = None
+        self._lock_depth = 0
+        self._seen = 0          # newest generation this worker has published or loaded
+        self._checked = 0.0
+
+    @property
+    def generation(self) -> int:
+        return self._seen
+
+    @contextmanager
+    def exclusive(self, blocking: bool = True):
+        """
+        Hold the cross-worker refresh lock; yields whether it was acquired.
+        Re-entrant within a process (callers serialize threads themselves).
+        """
+        if self._lock_depth == 0:
+            fd = os.open(os.path.join(self.directory, _LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                yield False
+                return
+            self._lock_fd = fd
+        self._lock_depth += 1
+        try:
+            yield True
+        finally:
+            self._lock_depth -= 1
+            if self._lock_depth == 0:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+                os.close(self._lock_fd)
+                self._lock_fd = None
+
+    def publish(self, frames: dict[str, pd.DataFrame], **meta) -> dict:
+        """Write frames as the next shared generation. Caller holds exclusive()."""
+        manifest = write_frame_generation(
+            self.directory, frames, fmt="arrow", keep=CACHE_GENERATIONS_KEEP, **meta
+        )
+        self._seen = manifest["generation"]
+        return manifest
+
+    def poll(self, force: bool = False) -> dict | None:
+        """Manifest of a generation newer than the last one seen, else None."""
+        now = time.monotonic()
+        if not force and now - self._checked < SHARED_POLL_SECONDS:
+            return None
+        self._checked = now
+        manifest = read_frame_manifest(self.directory)
+        if manifest is None or manifest["generation"] <= self._seen:
+            return None
+        return manifest
+
+    def load(self, manifest: dict) -> dict[str, pd.DataFrame]:
+        """Memory-map the frames of a polled generation and mark it seen."""
+        frames = read_frame_generation(manifest, compact=False)
+        self._seen = manifest["generation"]
+        return frames
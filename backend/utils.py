@@ -6,6 +6,9 @@ import math
 import pandas as pd
 import numpy as np
 from datetime import datetime
+from fastapi import HTTPException
+
+from backend.data_store import store, DataGeneration
 
 
 def safe_json(obj):
@@ -56,3 +59,11 @@ def filter_df(
     if status and "site_status" in df.columns:
         df = df[df["site_status"] == status]
     return df
+
+
+def generation_as_of(as_of: datetime | None) -> DataGeneration:
+    """Current generation, or the snapshot one for ?as_of= (404 if none that old)."""
+    gen = store.generation_as_of(as_of)
+    if gen is None:
+        raise HTTPException(status_code=404, detail=f"No snapshot at or before {as_of}")
+    return gen
@@ -0,0 +1,217 @@
+"""
+change_log.py — Append-only log of task-level changes between published generations.
+KP-HCIP Multi-Package Executive Dashboard
+
+Every task is identified by TASK_KEY (plus its order among tasks with the
+same key) and fingerprinted by a stable hash of its row, leaving out the
+columns that tick with the business date (DATE_COLUMNS), so a new day on
+its own records nothing. When a generation
+is published its hashes are compared with those of the last recorded one,
+and the inserted / updated / deleted tasks are appended as one numbered
+change-log generation:
+
+    CACHE_CHANGES_DIR/index.jsonl               one line per generation
+    CACHE_CHANGES_DIR/gen-000042.parquet        changed rows (_op, _generation, task columns)
+    CACHE_CHANGES_DIR/state.parquet             task keys + hashes of the last recorded frame
+
+Inserted and updated rows are stored whole, deleted ones as their key only.
+Generations without changes are not recorded. Consumers keep the last
+generation they applied and ask for the ones after it, so a sync costs
+O(changes). Only the newest CHANGE_LOG_KEEP generations are kept.
+"""
+
+import os
+import json
+import fcntl
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from config import TASK_KEY, CACHE_CHANGES_DIR, CHANGE_LOG_KEEP
+
+logger = logging.getLogger(__name__)
+
+_INDEX_FILE = "index.jsonl"
+_STATE_FILE = "state.parquet"
+_LOCK_FILE = ".lock"
+_OCCURRENCE = "_occurrence"
+
+# Task columns recomputed from today's date (transform.recompute_date_columns)
+DATE_COLUMNS = ["task_delay_days"]
+
+_state_cache: tuple[int, pd.DataFrame] | None = None
+
+
+# ---------------------------------------------------------------------------
+# Hashing
+# ---------------------------------------------------------------------------
+
+def task_keys(df_tasks: pd.DataFrame) -> pd.DataFrame:
+    """TASK_KEY columns (object-typed) plus each task's order among equal keys."""
+    keys = df_tasks[TASK_KEY].astype(object)
+    keys = keys.where(keys.notna(), None)
+    return keys.assign(**{_OCCURRENCE: keys.groupby(TASK_KEY, dropna=False).cumcount()})
+
+
+def task_hashes(df_tasks: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """(key hash, row hash) per task as uint64 arrays; the row hash skips DATE_COLUMNS."""
+    key_hash = pd.util.hash_pandas_object(task_keys(df_tasks), index=False).to_numpy()
+    row_hash = pd.util.hash_pandas_object(
+        df_tasks.drop(columns=DATE_COLUMNS, errors="ignore"), index=False
+    ).to_numpy()
+    return key_hash, row_hash
+
+
+# ---------------------------------------------------------------------------
+# Storage
+# ---------------------------------------------------------------------------
+
+def _path(name: str) -> str:
+    return os.path.join(CACHE_CHANGES_DIR, name)
+
+
+@contextmanager
+def _locked():
+    """Serialize recorders (worker threads and processes)."""
+    os.makedirs(CACHE_CHANGES_DIR, exist_ok=True)
+    fd = os.open(_path(_LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _read_index() -> list[dict]:
+    try:
+        with open(_path(_INDEX_FILE)) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def _write_parquet(df: pd.DataFrame, name: str):
+    tmp_path = _path(f".{name}.tmp")
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, _path(name))
+
+
+def _read_state() -> pd.DataFrame | None:
+    """Keys and hashes of the last recorded frame, cached until the file changes."""
+    global _state_cache
+    try:
+        mtime = os.stat(_path(_STATE_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if _state_cache is None or _state_cache[0] != mtime:
+        _state_cache = (mtime, pd.read_parquet(_path(_STATE_FILE)))
+    return _state_cache[1]
+
+
+def _prune(entries: list[dict]) -> list[dict]:
+    """Drop generations beyond CHANGE_LOG_KEEP (files first, then the index)."""
+    if len(entries) <= CHANGE_LOG_KEEP:
+        return entries
+    dropped, kept = entries[:-CHANGE_LOG_KEEP], entries[-CHANGE_LOG_KEEP:]
+    tmp_path = _path(f".{_INDEX_FILE}.tmp")
+    with open(tmp_path, "w") as f:
+        f.writelines(json.dumps(entry) + "\n" for entry in kept)
+    os.replace(tmp_path, _path(_INDEX_FILE))
+    for entry in dropped:
+        try:
+            os.remove(_path(entry["file"]))
+        except FileNotFoundError:
+            pass
+    return kept
+
+
+# ---------------------------------------------------------------------------
+# Record / read
+# ---------------------------------------------------------------------------
+
+def record_changes(df_tasks: pd.DataFrame) -> dict | None:
+    """
+    Compare df_tasks with the last recorded frame and append the inserted,
+    updated and deleted tasks as the next generation. Returns its index
+    entry, or None if nothing changed.
+    """
+    if df_tasks is None or df_tasks.empty:
+        return None
+    df_tasks = df_tasks.reset_index(drop=True)
+    keys = task_keys(df_tasks)
+    key_hash, row_hash = task_hashes(df_tasks)
+
+    with _locked():
+        state = _read_state()
+        if state is None:
+            old_keys = pd.Index([], dtype="uint64")
+            old_rows = np.array([], dtype="uint64")
+        else:
+            old_keys = pd.Index(state["_key_hash"].to_numpy())
+            old_rows = state["_row_hash"].to_numpy()
+
+        match = old_keys.get_indexer(key_hash)            # new task → old task, -1 if new
+        inserted = np.flatnonzero(match < 0)
+        paired = np.flatnonzero(match >= 0)
+        updated = paired[old_rows[match[paired]] != row_hash[paired]]
+        deleted = np.flatnonzero(~old_keys.isin(key_hash))
+        if not len(inserted) and not len(updated) and not len(deleted):
+            return None
+
+        entries = _read_index()
+        generation = entries[-1]["generation"] + 1 if entries else 1
+        rows = [
+            df_tasks.iloc[inserted].assign(_op="insert"),
+            df_tasks.iloc[updated].assign(_op="update"),
+        ]
+        if len(deleted):
+            rows.append(state.iloc[deleted][TASK_KEY].assign(_op="delete"))
+        changes = pd.concat(rows, ignore_index=True)
+        changes.insert(0, "_op", changes.pop("_op"))
+        changes.insert(0, "_generation", generation)
+        # Categories differ between frames; the log stores plain values
+        changes = changes.astype({
+            col: object for col, dtype in changes.dtypes.items()
+            if isinstance(dtype, pd.CategoricalDtype)
+        })
+        entry = {
+            "generation": generation,
+            "ts": datetime.now().isoformat(timespec="seconds"),
+            "inserted": len(inserted),
+            "updated": len(updated),
+            "deleted": len(deleted),
+            "file": f"gen-{generation:06d}.parquet",
+        }
+        _write_parquet(changes, entry["file"])
+        with open(_path(_INDEX_FILE), "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        _write_parquet(keys.assign(_key_hash=key_hash, _row_hash=row_hash), _STATE_FILE)
+        _prune(entries + [entry])
+
+    logger.info("Change log generation %d: %d inserted, %d updated, %d deleted",
+                generation, entry["inserted"], entry["updated"], entry["deleted"])
+    return entry
+
+
+def read_changes(since: int = 0) -> tuple[int, pd.DataFrame] | None:
+    """
+    (newest generation, changes of every generation after `since`) oldest
+    first, with _generation and _op ("insert", "update", "delete") columns.
+    None if generations after `since` were already pruned (full resync).
+    """
+    entries = _read_index()
+    if not entries:
+        return 0, pd.DataFrame()
+    latest = entries[-1]["generation"]
+    if since < entries[0]["generation"] - 1:
+        return None
+    wanted = [entry for entry in entries if entry["generation"] > since]
+    if not wanted:
+        return latest, pd.DataFrame()
+    frames = [pd.read_parquet(_path(entry["file"])) for entry in wanted]
+    return latest, pd.concat(frames, ignore_index=True)
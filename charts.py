@@ -117,24 +117,17 @@ def chart_ipc_health(df_site: pd.DataFrame) -> go.Figure:
     return fig
 
 
-def chart_trend_progress(df_snapshots: pd.DataFrame) -> go.Figure | None:
-    """Line chart: average site progress over time from snapshots."""
-    if df_snapshots.empty or "_snapshot_ts" not in df_snapshots.columns:
+def chart_trend_progress(df_trend: pd.DataFrame) -> go.Figure | None:
+    """Line chart: average site progress over time (global trend rollup)."""
+    if df_trend.empty or "_snapshot_ts" not in df_trend.columns:
         return None
 
-    trend = (
-        df_snapshots.groupby("_snapshot_ts")["site_progress"]
-        .mean()
-        .reset_index()
-        .sort_values("_snapshot_ts")
-    )
-
     fig = px.line(
-        trend,
+        df_trend.sort_values("_snapshot_ts"),
         x="_snapshot_ts",
-        y="site_progress",
+        y="avg_progress",
         markers=True,
-        labels={"_snapshot_ts": "Snapshot Date", "site_progress": "Avg Progress (%)"},
+        labels={"_snapshot_ts": "Snapshot Date", "avg_progress": "Avg Progress (%)"},
     )
     fig.update_layout(
         title="Progress Trend Over Time",
@@ -145,22 +138,13 @@ def chart_trend_progress(df_snapshots: pd.DataFrame) -> go.Figure | None:
     return fig
 
 
-def chart_trend_completed(df_snapshots: pd.DataFrame) -> go.Figure | None:
-    """Line chart: count of completed sites over time."""
-    if df_snapshots.empty or "_snapshot_ts" not in df_snapshots.columns:
+def chart_trend_completed(df_trend: pd.DataFrame) -> go.Figure | None:
+    """Line chart: count of completed sites over time (global trend rollup)."""
+    if df_trend.empty or "_snapshot_ts" not in df_trend.columns:
         return None
 
-    from config import COMPLETION_THRESHOLD
-
-    trend = (
-        df_snapshots.groupby("_snapshot_ts")
-        .apply(lambda g: (g["site_progress"] >= COMPLETION_THRESHOLD).sum(), include_groups=False)
-        .reset_index(name="completed_sites")
-        .sort_values("_snapshot_ts")
-    )
-
     fig = px.line(
-        trend,
+        df_trend.sort_values("_snapshot_ts"),
         x="_snapshot_ts",
         y="completed_sites",
         markers=True,
@@ -245,7 +229,7 @@ def chart_discipline_progress(df_tasks_site: pd.DataFrame) -> go.Figure:
         return go.Figure()
 
     disc = (
-        df_tasks_site.groupby("discipline", dropna=False)["progress_pct"]
+        df_tasks_site.groupby("discipline", dropna=False, observed=True)["progress_pct"]
         .mean()
         .reset_index()
         .rename(columns={"progress_pct": "avg_progress"})
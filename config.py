@@ -21,6 +21,11 @@ CSV_SOURCES = {
     "Warehouses Package-10": "https://docs.google.com/spreadsheets/d/e/2PACX-1vTrpyYcmR_1-9Apkn0l3O7NQHLcrx2hDe52NDxjO4KwofiAG1EWaKfYJPESyNjb8SjP2fWScshd6zMP/pub?output=csv",
 }
 
+# Local mirror: when set, every source is read from <dir>/<name>.parquet or
+# <dir>/<name>.csv instead of the URLs above (air-gapped copies, benchmarks).
+# CSV_SOURCES values may also be file:// URLs or other HTTP(S) endpoints.
+CSV_SOURCES_DIR = os.environ.get("CSV_SOURCES_DIR")
+
 # ---------------------------------------------------------------------------
 # Column Rename Map  (raw CSV header → canonical snake_case)
 # ---------------------------------------------------------------------------
@@ -38,10 +43,73 @@ COLUMN_RENAME_MAP = {
     "Variance": "variance",
 }
 
+# ---------------------------------------------------------------------------
+# Column Schema  (§3.1 column contract, keyed by canonical name)
+# ---------------------------------------------------------------------------
+# "date"     — DD/MM/YYYY, parsed to timestamps per column (a column with a
+#              malformed value is left to clean_tasks' dayfirst parse)
+# "int"      — integer (float when the column has blanks, as with read_csv)
+# "float"    — float
+# "category" — low-cardinality string, kept as a categorical from the parse on
+# "str"      — free text / URLs (progress_pct stays text: "%" is stripped in §8.6)
+COLUMN_SCHEMA = {
+    "package_id": "int",
+    "package_name": "category",
+    "district": "category",
+    "site_id": "str",
+    "site_name": "category",
+    "discipline": "category",
+    "task_name": "str",
+    "planned_start": "date",
+    "planned_finish": "date",
+    "planned_duration_days": "int",
+    "actual_start": "date",
+    "actual_finish": "date",
+    "progress_pct": "str",
+    "variance": "float",
+    "delay_flag_calc": "category",
+    "last_updated": "date",
+    "remarks": "str",
+    "before_photo_share_url": "str",
+    "before_photo_direct_url": "str",
+    "after_photo_share_url": "str",
+    "after_photo_direct_url": "str",
+    "mobilization_taken": "category",
+    "rfb_staff": "category",
+    "cesmps": "category",
+    "ohs": "category",
+    "ipc_1": "category",
+    "ipc_2": "category",
+    "ipc_3": "category",
+    "ipc_4": "category",
+    "ipc_5": "category",
+    "ipc_6": "category",
+}
+
+# CSV parser: "pyarrow" (schema-driven, reads only COLUMN_SCHEMA columns) or
+# "pandas" (infer every column). pyarrow falls back to pandas on a parse error.
+CSV_PARSE_ENGINE = os.environ.get("CSV_PARSE_ENGINE", "pyarrow")
+
+# Compact in-memory / Parquet representation of df_tasks and df_site:
+# low-cardinality strings become categoricals (Arrow dictionaries on disk)
+# and integer columns are downcast. Set COMPACT_FRAMES=0 to keep plain dtypes.
+COMPACT_FRAMES = os.environ.get("COMPACT_FRAMES", "1") == "1"
+COMPACT_CATEGORY_COLUMNS = [
+    "package_name", "district", "site_name", "discipline",
+    "task_status", "site_status", "delay_bucket", "delay_flag_calc",
+    "mobilization_taken", "cesmps",
+    "ohs", "ohs_month", "ohs_yesno",
+    "rfb_staff", "rfb_staff_month", "rfb_staff_yesno",
+    "ipc_1", "ipc_2", "ipc_3", "ipc_4", "ipc_5", "ipc_6",
+]
+
 # ---------------------------------------------------------------------------
 # Composite Site Key  (used for all site-level groupings)
 # ---------------------------------------------------------------------------
 SITE_KEY = ["package_name", "district", "site_name"]
+# Identifies a task across refreshes (change log); repeated task names within
+# a site are told apart by their order in the sheet
+TASK_KEY = SITE_KEY + ["discipline", "task_name"]
 
 # ---------------------------------------------------------------------------
 # Date Columns to parse (DD/MM/YYYY, dayfirst=True)
@@ -101,10 +169,47 @@ MOBILIZATION_PENALTY = 20  # added when mobilized_low_progress
 CACHE_DIR = os.environ.get("CACHE_DIR", "/tmp/data_cache")
 CACHE_LATEST_DIR = f"{CACHE_DIR}/latest"
 CACHE_SNAPSHOTS_DIR = f"{CACHE_DIR}/snapshots"
+CACHE_CHANGES_DIR = f"{CACHE_DIR}/changes"
+# Raw source bodies, gzipped and named by content hash (input of replay.py)
+CACHE_ARCHIVE_DIR = f"{CACHE_DIR}/archive"
+# Latest-cache format: "arrow" (uncompressed Arrow IPC, memory-mapped on load)
+# or "parquet". Snapshots are always Parquet.
+CACHE_FORMAT = os.environ.get("CACHE_FORMAT", "arrow")
+CACHE_GENERATIONS_KEEP = 3         # cache generation dirs kept on disk
 INMEMORY_TTL_SECONDS = 3600        # 1 hour
-MAX_SNAPSHOT_RETENTION_DAYS = 180
+REFRESH_RETRY_SECONDS = 300        # back-off after a failed background refresh
+GENERATION_HISTORY = 5             # in-memory generations kept for rollback
+CHANGE_LOG_KEEP = 500              # task change-log generations kept for /api/data/changes
+AS_OF_CACHE_SIZE = 4               # snapshot generations kept for ?as_of= requests (LRU)
+# Snapshot retention tiers: every snapshot for SNAPSHOT_FULL_DAYS, the last
+# of each day up to SNAPSHOT_DAILY_DAYS, the last of each ISO week up to
+# MAX_SNAPSHOT_RETENTION_DAYS; older ones are dropped.
+SNAPSHOT_FULL_DAYS = 28
+SNAPSHOT_DAILY_DAYS = 180
+MAX_SNAPSHOT_RETENTION_DAYS = 5 * 365
+SNAPSHOT_ROW_GROUP_ROWS = 256      # snapshot row group size (min/max stats per group)
+SNAPSHOT_KEYFRAME_INTERVAL = 30    # full snapshot every N; deltas in between
+# df_site columns kept in the per-site history index (/api/sites/history)
+SITE_HISTORY_COLUMNS = [
+    "site_progress", "site_delay_days", "delay_bucket", "site_status", "risk_score", "last_updated",
+]
+# df_site columns compared by /api/data/diff (a site counts as changed only
+# if one of these did); the delay columns tick every business date
+SNAPSHOT_DIFF_COLUMNS = ["site_status", "delay_bucket", "risk_score", "site_progress"]
+# Shared data plane for multi-worker deployments (uvicorn --workers N): one
+# worker (elected via flock) refreshes and publishes Arrow generations here,
+# the others memory-map them. Point at tmpfs, e.g. /dev/shm/dashy. Unset = off.
+SHARED_DATA_DIR = os.environ.get("SHARED_DATA_DIR")
+SHARED_POLL_SECONDS = 1.0          # how often workers check for a new generation
 HTTP_TIMEOUT_SECONDS = 30
 
+# ---------------------------------------------------------------------------
+# Fetch Settings
+# ---------------------------------------------------------------------------
+FETCH_MAX_WORKERS = int(os.environ.get("FETCH_MAX_WORKERS", "10"))  # 1 = sequential
+# Processes used by replay.py to rebuild snapshots from the archive (0 = one per CPU)
+REPLAY_MAX_WORKERS = int(os.environ.get("REPLAY_MAX_WORKERS", "0"))
+
 # ---------------------------------------------------------------------------
 # Timezone
 # ---------------------------------------------------------------------------
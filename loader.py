@@ -1,27 +1,66 @@
 """
-loader.py — Fetch CSV data from Google Sheets, disk caching, snapshot versioning.
+loader.py — Fetch CSV data (Google Sheets or local sources), disk caching, snapshot versioning.
 KP-HCIP Multi-Package Executive Dashboard
 """
 
 import io
 import os
+import csv
+import json
+import gzip
+import codecs
+import time
+import shutil
+import hashlib
 import logging
-from datetime import datetime, timedelta
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlparse
+from urllib.request import url2pathname
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.feather as pa_feather
 import requests
+from requests.adapters import HTTPAdapter
 
 from config import (
     CSV_SOURCES,
+    CSV_SOURCES_DIR,
     COLUMN_RENAME_MAP,
+    COLUMN_SCHEMA,
+    CSV_PARSE_ENGINE,
+    COMPACT_FRAMES,
     CACHE_DIR,
     CACHE_LATEST_DIR,
     CACHE_SNAPSHOTS_DIR,
+    CACHE_ARCHIVE_DIR,
+    CACHE_FORMAT,
+    CACHE_GENERATIONS_KEEP,
     HTTP_TIMEOUT_SECONDS,
+    FETCH_MAX_WORKERS,
     INMEMORY_TTL_SECONDS,
-    MAX_SNAPSHOT_RETENTION_DAYS,
+    SNAPSHOT_DIFF_COLUMNS,
     TIMEZONE,
 )
+from transform import (
+    clean_tasks,
+    build_site_summary,
+    compact_frame,
+    concat_frames,
+    recompute_date_columns,
+    _get_today,
+)
+from snapshot_store import (
+    write_snapshot, read_snapshots, read_rollups, compact_snapshots, snapshot_at,
+    read_site_history, diff_snapshots,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -35,89 +74,805 @@ def _ensure_dirs():
         os.makedirs(d, exist_ok=True)
 
 
+# ---------------------------------------------------------------------------
+# Shared HTTP session
+# ---------------------------------------------------------------------------
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def _get_session() -> requests.Session:
+    """
+    Return a process-wide keep-alive session.
+    All sheets live on the same host, so one pooled connection per worker
+    avoids a fresh TLS handshake for every source.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=max(1, FETCH_MAX_WORKERS),
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({"Accept-Encoding": "gzip, deflate"})
+                _session = session
+    return _session
+
+
+# ---------------------------------------------------------------------------
+# Source adapters
+# ---------------------------------------------------------------------------
+#
+# A CSV_SOURCES value is a location resolved to an adapter by URL scheme:
+#   http(s)://…  → HttpSource      (conditional GET with ETag / Last-Modified)
+#   file://…     → FileSource      (local file; mtime/size change detection)
+#   anything else with CSV_SOURCES_DIR set → LocalDirSource, which looks up
+#   <CSV_SOURCES_DIR>/<source name>.parquet or .csv
+# Each adapter returns (content, state): content is None when the previous
+# state shows the source is unchanged, so it is not read at all.
+
+class SourceAdapter(ABC):
+    """Base class: fetch raw bytes for a source location."""
+
+    @abstractmethod
+    def fetch(self, name: str, location: str, previous: dict | None) -> tuple[bytes | None, dict]:
+        """
+        Return (content, state). state must include "format" ("csv" or
+        "parquet") and any validators needed for the next call.
+        """
+
+
+class HttpSource(SourceAdapter):
+    """Generic HTTP(S) source, e.g. a published Google Sheet or a local mirror."""
+
+    def fetch(self, name, location, previous):
+        headers = {}
+        if previous:
+            if previous.get("etag"):
+                headers["If-None-Match"] = previous["etag"]
+            if previous.get("last_modified"):
+                headers["If-Modified-Since"] = previous["last_modified"]
+
+        resp = _get_session().get(location, headers=headers, timeout=HTTP_TIMEOUT_SECONDS)
+        if resp.status_code == 304 and previous:
+            return None, previous
+        resp.raise_for_status()
+        fmt = "parquet" if urlparse(location).path.endswith(".parquet") else "csv"
+        return resp.content, {
+            "format": fmt,
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+        }
+
+
+class FileSource(SourceAdapter):
+    """Local file given as a file:// URL or a plain path."""
+
+    def fetch(self, name, location, previous):
+        path = url2pathname(urlparse(location).path) if location.startswith("file://") else location
+        st = os.stat(path)
+        state = {
+            "format": "parquet" if path.endswith(".parquet") else "csv",
+            "path": path,
+            "mtime_ns": st.st_mtime_ns,
+            "size": st.st_size,
+        }
+        if previous and all(previous.get(k) == state[k] for k in ("path", "mtime_ns", "size")):
+            return None, previous
+        with open(path, "rb") as f:
+            return f.read(), state
+
+
+class LocalDirSource(SourceAdapter):
+    """Directory of <source name>.parquet / <source name>.csv files (a local sync)."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def fetch(self, name, location, previous):
+        for ext in (".parquet", ".csv"):
+            path = os.path.join(self.directory, name + ext)
+            if os.path.exists(path):
+                return FileSource().fetch(name, path, previous)
+        raise FileNotFoundError(f"No .parquet or .csv for {name!r} in {self.directory}")
+
+
+SOURCE_ADAPTERS: dict[str, SourceAdapter] = {
+    "http": HttpSource(),
+    "https": HttpSource(),
+    "file": FileSource(),
+}
+
+
+def register_source_adapter(scheme: str, adapter: SourceAdapter):
+    """
+    Register an adapter instance for locations with the given URL scheme.
+    An adapter class without fetch already fails when it is instantiated.
+    """
+    if not isinstance(adapter, SourceAdapter):
+        raise TypeError(f"{type(adapter).__name__} is not a SourceAdapter")
+    SOURCE_ADAPTERS[scheme] = adapter
+
+
+def _resolve_source(name: str) -> tuple[SourceAdapter, str]:
+    """Pick the adapter and location for a source name."""
+    if CSV_SOURCES_DIR:
+        return LocalDirSource(CSV_SOURCES_DIR), name
+    location = CSV_SOURCES[name]
+    scheme = urlparse(location).scheme
+    if scheme in SOURCE_ADAPTERS:
+        return SOURCE_ADAPTERS[scheme], location
+    return SOURCE_ADAPTERS["file"], location
+
+
 # ---------------------------------------------------------------------------
 # Single CSV fetch
 # ---------------------------------------------------------------------------
 
-def _fetch_one_csv(name: str, url: str) -> pd.DataFrame | None:
+_ARROW_TYPES = {
+    "date": pa.string(),        # parsed per column (_arrow_dates)
+    "int": pa.int64(),
+    "float": pa.float64(),
+    "category": pa.dictionary(pa.int32(), pa.string()),
+    "str": pa.string(),
+}
+
+
+def _parse_csv_pandas(content: bytes) -> pd.DataFrame:
+    """Parse raw CSV bytes with pandas type inference."""
+    df = pd.read_csv(io.BytesIO(content))
+    # Strip whitespace from column headers
+    df.columns = df.columns.str.strip()
+    # Apply rename map
+    df.rename(columns=COLUMN_RENAME_MAP, inplace=True)
+    return df
+
+
+def _arrow_dates(col: pa.ChunkedArray) -> pa.ChunkedArray:
     """
-    Download a single CSV from a published Google Sheets URL.
-    Returns DataFrame or None on failure.
+    A date column as timestamps, or left as strings if any value is not
+    %d/%m/%Y: clean_tasks then parses that column like the pandas path.
     """
     try:
-        resp = requests.get(url, timeout=HTTP_TIMEOUT_SECONDS)
-        resp.raise_for_status()
-        df = pd.read_csv(io.StringIO(resp.text))
-        # Strip whitespace from column headers
-        df.columns = df.columns.str.strip()
-        # Apply rename map
-        df.rename(columns=COLUMN_RENAME_MAP, inplace=True)
-        return df
+        return pc.strptime(col, format="%d/%m/%Y", unit="ns")
+    except pa.ArrowInvalid:
+        return col
+
+
+def _parse_csv_arrow(content: bytes) -> pd.DataFrame:
+    """
+    Parse raw CSV bytes with the pyarrow reader and the §3.1 COLUMN_SCHEMA.
+    Only contract columns are read; numerics and (well-formed) dates arrive
+    typed, and "category" columns stay dictionary-encoded as categoricals
+    with sorted categories (as compact_frame keeps them). Raises on a
+    numeric value that does not fit the schema.
+    """
+    if content.startswith(codecs.BOM_UTF8):
+        content = content[len(codecs.BOM_UTF8):]
+
+    # Map raw headers → canonical names (§8.0) to pick columns and types
+    header_line = content.split(b"\n", 1)[0].rstrip(b"\r").decode("utf-8")
+    raw_headers = next(csv.reader([header_line]), [])
+    canonical = {}
+    for raw in raw_headers:
+        name = COLUMN_RENAME_MAP.get(raw.strip(), raw.strip())
+        if name in COLUMN_SCHEMA and name not in canonical.values():
+            canonical[raw] = name
+
+    table = pa_csv.read_csv(
+        pa.BufferReader(content),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=list(canonical),
+            column_types={raw: _ARROW_TYPES[COLUMN_SCHEMA[name]] for raw, name in canonical.items()},
+            strings_can_be_null=True,
+        ),
+    )
+
+    names = [canonical[raw] for raw in table.column_names]
+    columns = []
+    for name, col in zip(names, table.columns):
+        if COLUMN_SCHEMA[name] == "date":
+            col = _arrow_dates(col)
+        elif pa.types.is_dictionary(col.type) and not COMPACT_FRAMES:
+            col = col.cast(col.type.value_type)
+        columns.append(col)
+    df = pa.table(columns, names=names).to_pandas()
+
+    # Dictionaries come in order of appearance; sorted categories keep
+    # sorting and groupby order the same as on plain strings
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].cat.reorder_categories(df[col].cat.categories.sort_values())
+    return df
+
+
+def _parse_csv_bytes(content: bytes) -> pd.DataFrame:
+    """Parse raw CSV bytes into a DataFrame with canonical column names."""
+    if CSV_PARSE_ENGINE == "pyarrow":
+        try:
+            return _parse_csv_arrow(content)
+        except Exception as exc:
+            logger.info("Schema parse failed (%s) — falling back to pandas", exc)
+    return _parse_csv_pandas(content)
+
+
+def _parse_parquet_bytes(content: bytes) -> pd.DataFrame:
+    """Read a Parquet export and apply the §8.0 header normalization."""
+    df = pd.read_parquet(io.BytesIO(content))
+    df.columns = df.columns.str.strip()
+    df.rename(columns=COLUMN_RENAME_MAP, inplace=True)
+    return df
+
+
+def _fetch_source(name: str, previous: dict | None = None) -> dict:
+    """
+    Fetch and parse one source through its adapter.
+
+    previous is the source's state from the last refresh (validators plus
+    sha256). When given, the adapter may skip the transfer entirely, and an
+    identical body is not re-parsed. Returns a result dict with keys name,
+    status ("ok", "unchanged" or "failed"), df, state and seconds.
+    """
+    start = time.perf_counter()
+    result = {"name": name, "status": "failed", "df": None, "state": previous}
+
+    try:
+        adapter, location = _resolve_source(name)
+        content, state = adapter.fetch(name, location, previous)
+        if content is None:
+            result["status"] = "unchanged"
+        else:
+            state = {**state, "sha256": hashlib.sha256(content).hexdigest()}
+            result["state"] = state
+            archive_source(content, state["sha256"], state.get("format", "csv"))
+            if previous and previous.get("sha256") == state["sha256"]:
+                result["status"] = "unchanged"
+            else:
+                if state.get("format") == "parquet":
+                    result["df"] = _parse_parquet_bytes(content)
+                else:
+                    result["df"] = _parse_csv_bytes(content)
+                result["status"] = "ok"
     except Exception as exc:
         logger.warning("Failed to load %s: %s", name, exc)
-        return None
+
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def _fetch_sources(
+    names: list[str],
+    previous_state: dict[str, dict] | None = None,
+    max_workers: int | None = None,
+) -> list[dict]:
+    """
+    Fetch the named sources concurrently (see _fetch_source).
+    Results are returned in the order of names.
+    """
+    previous_state = previous_state or {}
+    workers = max(1, min(max_workers or FETCH_MAX_WORKERS, len(names) or 1))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="csv-fetch") as pool:
+        # map() preserves the input order, so concatenation stays deterministic
+        results = list(pool.map(
+            lambda n: _fetch_source(n, previous_state.get(n)),
+            names,
+        ))
+    elapsed = time.perf_counter() - start
+
+    logger.info(
+        "Fetched %d sources in %.2fs (%d workers, slowest %.2fs)",
+        len(results), elapsed, workers,
+        max((r["seconds"] for r in results), default=0.0),
+    )
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Raw source archive
+# ---------------------------------------------------------------------------
+#
+# Every fetched body is kept once, gzipped and named by its sha256:
+#   CACHE_ARCHIVE_DIR/<sha256[:2]>/<sha256>.<format>.gz
+# Snapshot index entries record the hashes they were built from, so
+# replay.py can rebuild any snapshot from the original inputs.
+
+_ARCHIVE_FORMATS = ("csv", "parquet")
+
+
+def _archive_path(sha256: str, fmt: str) -> str:
+    return os.path.join(CACHE_ARCHIVE_DIR, sha256[:2], f"{sha256}.{fmt}.gz")
+
+
+def archive_source(content: bytes, sha256: str, fmt: str = "csv"):
+    """Store a fetched body under its content hash (no-op if already there)."""
+    path = _archive_path(sha256, fmt)
+    if os.path.exists(path):
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(gzip.compress(content, compresslevel=6))
+        os.replace(tmp_path, path)
+    except Exception as exc:
+        logger.warning("Failed to archive source %s: %s", sha256[:12], exc)
+
+
+def read_archived_source(sha256: str) -> pd.DataFrame | None:
+    """Parse an archived body like a fresh fetch. None if it is not archived."""
+    for fmt in _ARCHIVE_FORMATS:
+        path = _archive_path(sha256, fmt)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                content = gzip.decompress(f.read())
+            return _parse_parquet_bytes(content) if fmt == "parquet" else _parse_csv_bytes(content)
+    return None
 
 
 # ---------------------------------------------------------------------------
-# Fetch all CSVs and concatenate
+# Incremental refresh: per-package parts
 # ---------------------------------------------------------------------------
+#
+# A "part" is the cleaned (df_tasks, df_site) pair for one CSV source. Both
+# clean_tasks and build_site_summary work row-/site-wise within a package, so
+# parts can be rebuilt independently and concatenated.
+
+def load_source_state() -> dict[str, dict]:
+    """Load per-source validators and content hashes from the last refresh."""
+    path = os.path.join(CACHE_LATEST_DIR, "sources.json")
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except Exception as exc:
+            logger.warning("Failed to read source state: %s", exc)
+    return {}
+
 
-def fetch_all_csvs() -> tuple[pd.DataFrame, list[str], list[str]]:
+def save_source_state(state: dict[str, dict]):
+    """Persist per-source validators and content hashes."""
+    _ensure_dirs()
+    path = os.path.join(CACHE_LATEST_DIR, "sources.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def split_parts(
+    df_tasks: pd.DataFrame | None,
+    df_site: pd.DataFrame | None,
+) -> dict[str, tuple[pd.DataFrame, pd.DataFrame]]:
     """
-    Fetch all 10 CSV sources, concatenate into a single DataFrame.
-    Returns (df_tasks, succeeded_names, failed_names).
+    Split combined frames back into per-source parts by package_name.
+    Returns {} unless every row belongs to a known source, so a partial split
+    can never drop rows on the next refresh.
     """
-    frames = []
-    succeeded = []
-    failed = []
+    if df_tasks is None or df_tasks.empty or "package_name" not in df_tasks.columns:
+        return {}
+    if df_site is None or df_site.empty:
+        return {}
+    if not df_tasks["package_name"].isin(list(CSV_SOURCES)).all():
+        return {}
 
-    for name, url in CSV_SOURCES.items():
-        df = _fetch_one_csv(name, url)
-        if df is not None and not df.empty:
-            frames.append(df)
-            succeeded.append(name)
-        else:
-            failed.append(name)
+    parts = {}
+    for name in CSV_SOURCES:
+        tasks = df_tasks[df_tasks["package_name"] == name]
+        if tasks.empty:
+            continue
+        site = df_site[df_site["package_name"] == name]
+        parts[name] = (tasks.reset_index(drop=True), site.reset_index(drop=True))
+    return parts
 
-    if frames:
-        df_tasks = pd.concat(frames, ignore_index=True)
-    else:
-        df_tasks = pd.DataFrame()
 
-    return df_tasks, succeeded, failed
+def assemble_parts(
+    parts: dict[str, tuple[pd.DataFrame, pd.DataFrame]],
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Concatenate per-source parts into (df_tasks, df_site).
+    Row order matches a full rebuild: tasks in CSV_SOURCES order, sites in
+    groupby (package_name) order.
+    """
+    names = [n for n in CSV_SOURCES if n in parts]
+    if not names:
+        return pd.DataFrame(), pd.DataFrame()
+
+    df_tasks = concat_frames([parts[n][0] for n in names], ignore_index=True)
+    df_site = concat_frames([parts[n][1] for n in names], ignore_index=True)
+    if not df_site.empty:
+        df_site = df_site.sort_values("package_name", kind="stable").reset_index(drop=True)
+    return df_tasks, df_site
+
+
+def refresh_parts(
+    parts: dict[str, tuple[pd.DataFrame, pd.DataFrame]],
+    source_state: dict[str, dict],
+    names: list[str] | None = None,
+    max_workers: int | None = None,
+) -> tuple[dict, dict, dict]:
+    """
+    Re-fetch sources and rebuild only the parts whose content changed.
+
+    Sources with an existing part send their stored validators; a 304 or an
+    identical content hash skips read_csv, clean_tasks and build_site_summary.
+    Failed sources keep their previous part. Every part not rebuilt here is
+    then rolled to the current business date (see roll_parts).
+
+    Returns (parts, source_state, report) where report holds succeeded, failed,
+    unchanged, rolled and timings.
+    """
+    names = list(names or CSV_SOURCES)
+    today = _get_today()
+    business_date = str(today.date())
+    previous = {n: source_state[n] for n in names if n in parts and n in source_state}
+
+    parts = dict(parts)
+    source_state = dict(source_state)
+    report = {"succeeded": [], "failed": [], "unchanged": [], "rolled": [], "timings": {}}
+
+    for res in _fetch_sources(names, previous, max_workers):
+        name = res["name"]
+        report["timings"][name] = res["seconds"]
+
+        if res["status"] == "unchanged":
+            report["unchanged"].append(name)
+            report["succeeded"].append(name)
+            continue
+
+        df_raw = res["df"]
+        if res["status"] != "ok" or df_raw is None or df_raw.empty:
+            report["failed"].append(name)
+            continue
+
+        df_tasks = clean_tasks(df_raw, today)
+        parts[name] = (compact_frame(df_tasks), compact_frame(build_site_summary(df_tasks)))
+        source_state[name] = {**res["state"], "business_date": business_date}
+        report["succeeded"].append(name)
+
+    parts, source_state, report["rolled"] = roll_parts(parts, source_state, today)
+
+    logger.info(
+        "Refresh: %d rebuilt, %d unchanged, %d failed, %d rolled to %s",
+        len(report["succeeded"]) - len(report["unchanged"]),
+        len(report["unchanged"]),
+        len(report["failed"]),
+        len(report["rolled"]),
+        business_date,
+    )
+    return parts, source_state, report
+
+
+def roll_parts(
+    parts: dict[str, tuple[pd.DataFrame, pd.DataFrame]],
+    source_state: dict[str, dict],
+    today: pd.Timestamp | None = None,
+) -> tuple[dict, dict, list[str]]:
+    """
+    Recompute the date-dependent columns of every part built on an earlier
+    business date (Asia/Karachi). No fetch and no re-cleaning: milliseconds
+    per part. Returns (parts, source_state, rolled names).
+    """
+    if today is None:
+        today = _get_today()
+    business_date = str(today.date())
+
+    parts = dict(parts)
+    source_state = dict(source_state)
+    rolled = []
+    for name, (df_tasks, df_site) in parts.items():
+        state = source_state.get(name, {})
+        if state.get("business_date") == business_date:
+            continue
+        df_tasks, df_site = recompute_date_columns(df_tasks, df_site, today)
+        parts[name] = (compact_frame(df_tasks), compact_frame(df_site))
+        source_state[name] = {**state, "business_date": business_date}
+        rolled.append(name)
+    return parts, source_state, rolled
+
+
+def roll_business_date(
+    df_tasks: pd.DataFrame,
+    df_site: pd.DataFrame,
+    source_state: dict[str, dict],
+    today: pd.Timestamp | None = None,
+) -> tuple[pd.DataFrame, pd.DataFrame, dict]:
+    """
+    Bring combined frames up to today's business date in one pass and mark
+    every source as rolled. Frames every source already rolled to today are
+    returned as given. Returns (df_tasks, df_site, source_state).
+    """
+    if today is None:
+        today = _get_today()
+    business_date = str(today.date())
+
+    names = set(CSV_SOURCES) | set(source_state)
+    if all(source_state.get(name, {}).get("business_date") == business_date for name in names):
+        return df_tasks, df_site, source_state
+    if df_tasks is not None and not df_tasks.empty:
+        df_tasks, df_site = recompute_date_columns(df_tasks, df_site, today)
+        df_tasks, df_site = compact_frame(df_tasks), compact_frame(df_site)
+    source_state = {
+        name: {**source_state.get(name, {}), "business_date": business_date}
+        for name in names
+    }
+    return df_tasks, df_site, source_state
 
 
 # ---------------------------------------------------------------------------
 # Disk cache: save / load latest
 # ---------------------------------------------------------------------------
 
-def save_latest_cache(df_tasks: pd.DataFrame, df_site: pd.DataFrame):
-    """Persist latest df_tasks and df_site as Parquet files."""
+# Layout (all under CACHE_LATEST_DIR):
+#   gen-000042/df_tasks.arrow, df_site.arrow, manifest.json   one per save
+#   CURRENT                                                    name of the live generation
+# A save writes a private .tmp-* directory, renames it to the next gen-NNNNNN
+# and then swaps CURRENT with os.replace, so a crash or a concurrent reader
+# only ever sees a complete, matching pair.
+
+_CACHE_EXTENSIONS = {"arrow": ".arrow", "parquet": ".parquet"}
+_CACHE_POINTER = "CURRENT"
+_CACHE_MANIFEST = "manifest.json"
+_CACHE_FRAMES = ("df_tasks", "df_site")
+
+
+def _fsync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_json_durable(path: str, payload: dict):
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _arrow_cache_table(df: pd.DataFrame) -> pa.Table:
+    """
+    df as one Arrow record batch for the memory-mapped cache. Float NaN and
+    datetime NaT are kept as values instead of Arrow nulls: a validity
+    bitmap would force the reader to build a new NaN/NaT-filled array.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False).combine_chunks()
+    for i, name in enumerate(table.column_names):
+        col = df[name]
+        if table.column(i).null_count == 0 or not isinstance(col.dtype, np.dtype):
+            continue
+        values = col.to_numpy()
+        if col.dtype.kind == "f":
+            array = pa.array(values, from_pandas=False)
+        elif col.dtype.kind == "M":
+            array = pa.array(values.view("i8")).view(table.field(i).type)
+        else:
+            continue
+        table = table.set_column(i, table.field(i), array)
+    return table
+
+
+def _write_cache_frame(df: pd.DataFrame, path: str):
+    """Write one cache frame in the format given by the path's extension."""
+    if path.endswith(".arrow"):
+        # One uncompressed record batch: readers can then map each column's
+        # buffers directly instead of decoding or concatenating chunks
+        table = _arrow_cache_table(df)
+        pa_feather.write_feather(
+            table, path, compression="uncompressed", chunksize=max(table.num_rows, 1)
+        )
+    else:
+        df.to_parquet(path, index=False)
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+
+
+def _read_cache_frame(path: str) -> pd.DataFrame:
+    """
+    Arrow IPC files are memory-mapped, and numeric, timestamp and string
+    columns are wrapped zero-copy, so workers on one host share the page
+    cache. All-null string columns are copied. Categorical codes (one to
+    two bytes per row; the categories are small) are copied by to_pandas
+    on most supported pyarrow/pandas releases. Only recent ones (e.g.
+    pyarrow 26 with pandas 3) map those without missing values.
+    Parquet is decoded in full.
+    """
+    if path.endswith(".arrow"):
+        table = pa_feather.read_table(path, memory_map=True)
+        return table.to_pandas(split_blocks=True)
+    return pd.read_parquet(path)
+
+
+def read_frame_manifest(directory: str) -> dict | None:
+    """
+    Manifest of the live generation in `directory`, or None if there is none.
+    Reads two small files only, so other processes can poll it to notice a
+    new generation. "path" is added with the generation directory.
+    """
+    try:
+        with open(os.path.join(directory, _CACHE_POINTER)) as f:
+            name = f.read().strip()
+        path = os.path.join(directory, name)
+        with open(os.path.join(path, _CACHE_MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    manifest["path"] = path
+    return manifest
+
+
+def read_frame_generation(manifest: dict, compact: bool = True) -> dict[str, pd.DataFrame]:
+    """
+    Load every frame listed in a manifest (Arrow files are memory-mapped).
+    compact=False returns the frames exactly as written.
+    """
+    frames = {
+        frame: _read_cache_frame(os.path.join(manifest["path"], filename))
+        for frame, filename in manifest["files"].items()
+    }
+    if compact:
+        frames = {frame: compact_frame(df) for frame, df in frames.items()}
+    return frames
+
+
+def _prune_generations(directory: str, current: str, keep: int):
+    """Keep the newest `keep` generations; drop abandoned temp dirs."""
+    names = sorted(n for n in os.listdir(directory) if n.startswith("gen-"))
+    for name in names[:-keep]:
+        if name != current:
+            # Workers still mapping these files keep their (unlinked) pages
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    cutoff = time.time() - 3600
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.startswith(".tmp-") and os.path.getmtime(path) < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def write_frame_generation(
+    directory: str,
+    frames: dict[str, pd.DataFrame],
+    fmt: str = CACHE_FORMAT,
+    keep: int = CACHE_GENERATIONS_KEEP,
+    **fields,
+) -> dict:
+    """
+    Write `frames` as the next generation in `directory` and make it current.
+    Extra keyword fields are stored in the manifest. Returns the manifest.
+    """
+    os.makedirs(directory, exist_ok=True)
+    previous = read_frame_manifest(directory)
+    ext = _CACHE_EXTENSIONS.get(fmt, ".parquet")
+
+    tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=directory)
+    try:
+        os.chmod(tmp_dir, 0o755)  # mkdtemp is owner-only; other workers read it
+        files = {}
+        for frame, df in frames.items():
+            files[frame] = frame + ext
+            _write_cache_frame(df, os.path.join(tmp_dir, files[frame]))
+
+        manifest = {
+            "generation": (previous["generation"] if previous else 0) + 1,
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "format": fmt,
+            "files": files,
+            "rows": {frame: len(df) for frame, df in frames.items()},
+            **fields,
+        }
+        # Another process may have claimed the same number: take the next one
+        while True:
+            _write_json_durable(os.path.join(tmp_dir, _CACHE_MANIFEST), manifest)
+            name = f"gen-{manifest['generation']:06d}"
+            try:
+                os.rename(tmp_dir, os.path.join(directory, name))
+                break
+            except OSError:
+                if not os.path.exists(os.path.join(directory, name)):
+                    raise
+                manifest["generation"] += 1
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    pointer = os.path.join(directory, _CACHE_POINTER)
+    tmp_pointer = f"{pointer}.{os.getpid()}.tmp"
+    with open(tmp_pointer, "w") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_pointer, pointer)
+    _fsync_dir(directory)
+
+    _prune_generations(directory, name, keep)
+    manifest["path"] = os.path.join(directory, name)
+    return manifest
+
+
+def read_cache_manifest() -> dict | None:
+    """Manifest of the current latest-cache generation (see read_frame_manifest)."""
+    return read_frame_manifest(CACHE_LATEST_DIR)
+
+
+def _remove_legacy_cache():
+    """Drop flat df_*.parquet / df_*.arrow files from before generation dirs."""
+    for frame in _CACHE_FRAMES:
+        for ext in _CACHE_EXTENSIONS.values():
+            path = os.path.join(CACHE_LATEST_DIR, frame + ext)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def save_latest_cache(
+    df_tasks: pd.DataFrame,
+    df_site: pd.DataFrame,
+    source_state: dict[str, dict] | None = None,
+    build_seconds: float | None = None,
+) -> dict:
+    """
+    Persist df_tasks and df_site in CACHE_FORMAT as a new cache generation
+    and make it current. Returns its manifest.
+    """
     _ensure_dirs()
-    df_tasks.to_parquet(os.path.join(CACHE_LATEST_DIR, "df_tasks.parquet"), index=False)
-    df_site.to_parquet(os.path.join(CACHE_LATEST_DIR, "df_site.parquet"), index=False)
+    manifest = write_frame_generation(
+        CACHE_LATEST_DIR,
+        {"df_tasks": df_tasks, "df_site": df_site},
+        sources={name: state.get("sha256") for name, state in (source_state or {}).items()},
+        build_seconds=round(build_seconds, 3) if build_seconds is not None else None,
+    )
+    _remove_legacy_cache()
+    return manifest
 
 
-def load_latest_cache() -> tuple[pd.DataFrame | None, pd.DataFrame | None]:
-    """Load cached df_tasks and df_site from disk. Returns (None, None) if missing."""
-    tasks_path = os.path.join(CACHE_LATEST_DIR, "df_tasks.parquet")
-    site_path = os.path.join(CACHE_LATEST_DIR, "df_site.parquet")
+def _legacy_cache_paths() -> tuple[str, str] | None:
+    """Flat cache files from before generation dirs, preferring CACHE_FORMAT."""
+    formats = [CACHE_FORMAT] + [f for f in _CACHE_EXTENSIONS if f != CACHE_FORMAT]
+    for fmt in formats:
+        ext = _CACHE_EXTENSIONS[fmt]
+        paths = tuple(os.path.join(CACHE_LATEST_DIR, frame + ext) for frame in _CACHE_FRAMES)
+        if all(os.path.exists(p) for p in paths):
+            return paths
+    return None
 
-    if os.path.exists(tasks_path) and os.path.exists(site_path):
-        try:
-            df_tasks = pd.read_parquet(tasks_path)
-            df_site = pd.read_parquet(site_path)
-            return df_tasks, df_site
-        except Exception as exc:
-            logger.warning("Failed to read cache: %s", exc)
+
+def load_latest_cache() -> tuple[pd.DataFrame | None, pd.DataFrame | None]:
+    """
+    Load df_tasks and df_site of the current cache generation (or a legacy
+    flat cache). Returns (None, None) if missing.
+    """
+    manifest = read_cache_manifest()
+    try:
+        if manifest is not None:
+            frames = read_frame_generation(manifest)
+            return frames["df_tasks"], frames["df_site"]
+        paths = _legacy_cache_paths()
+        if paths is not None:
+            # Categoricals round-trip through Arrow/Parquet dictionaries;
+            # compact_frame only converts caches written with plain dtypes.
+            return (
+                compact_frame(_read_cache_frame(paths[0])),
+                compact_frame(_read_cache_frame(paths[1])),
+            )
+    except Exception as exc:
+        logger.warning("Failed to read cache: %s", exc)
     return None, None
 
 
 def get_cache_timestamp() -> str | None:
-    """Return the last modification time of the cached df_site file."""
-    site_path = os.path.join(CACHE_LATEST_DIR, "df_site.parquet")
-    if os.path.exists(site_path):
-        mtime = os.path.getmtime(site_path)
+    """Return when the current cache generation was written."""
+    manifest = read_cache_manifest()
+    if manifest is not None:
+        return manifest.get("created_at")
+    paths = _legacy_cache_paths()
+    if paths is not None:
+        mtime = os.path.getmtime(paths[1])
         return datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M:%S")
     return None
 
@@ -126,58 +881,83 @@ def get_cache_timestamp() -> str | None:
 # Snapshot versioning (for trend charts)
 # ---------------------------------------------------------------------------
 
-def save_snapshot(df_site: pd.DataFrame):
-    """Save a timestamped snapshot of df_site for trend analysis."""
+def save_snapshot(df_site: pd.DataFrame, source_state: dict[str, dict] | None = None):
+    """
+    Append a timestamped snapshot of df_site for trend analysis (see
+    snapshot_store). With source_state, the snapshot records the business
+    date and the archived source hashes it was built from (see replay.py).
+    """
     _ensure_dirs()
-    now = datetime.now()
-    filename = now.strftime("%Y-%m-%dT%H-%M-%S") + ".parquet"
-    path = os.path.join(CACHE_SNAPSHOTS_DIR, filename)
-    df_site_copy = df_site.copy()
-    df_site_copy["_snapshot_ts"] = now
-    df_site_copy.to_parquet(path, index=False)
-    logger.info("Saved snapshot: %s", path)
+    inputs = None
+    if source_state and all(state.get("sha256") for state in source_state.values()):
+        dates = [state["business_date"] for state in source_state.values() if state.get("business_date")]
+        inputs = {
+            "business_date": max(dates, default=str(_get_today().date())),
+            "sources": {name: state["sha256"] for name, state in source_state.items()},
+        }
+    entry = write_snapshot(df_site, inputs=inputs)
+    if entry["kind"] == "same":
+        logger.info("Snapshot unchanged since the previous one — index entry only")
+    else:
+        logger.info("Saved snapshot (%s, %d changed sites): %s",
+                    entry["kind"], entry["changed"], entry["file"])
 
 
-def load_all_snapshots() -> pd.DataFrame:
-    """Load and concatenate all historical snapshots. Returns empty DataFrame if none."""
+def load_all_snapshots(columns: list[str] | None = None, **filters) -> pd.DataFrame:
+    """
+    Load historical snapshots, optionally only some columns or a time range /
+    packages / sites (see snapshot_store.read_snapshots). Returns empty
+    DataFrame if none.
+    """
     _ensure_dirs()
-    snapshot_dir = CACHE_SNAPSHOTS_DIR
-    files = sorted(
-        [f for f in os.listdir(snapshot_dir) if f.endswith(".parquet")]
-    )
-    if not files:
-        return pd.DataFrame()
+    return read_snapshots(columns=columns, **filters)
 
-    frames = []
-    for f in files:
-        try:
-            df = pd.read_parquet(os.path.join(snapshot_dir, f))
-            frames.append(df)
-        except Exception as exc:
-            logger.warning("Failed to load snapshot %s: %s", f, exc)
 
-    if frames:
-        return pd.concat(frames, ignore_index=True)
-    return pd.DataFrame()
+def load_site_history(site: tuple, **filters) -> pd.DataFrame:
+    """
+    One site's SITE_HISTORY_COLUMNS per snapshot, optionally within a time
+    range (see snapshot_store.read_site_history). Empty if unknown.
+    """
+    _ensure_dirs()
+    return read_site_history(site, **filters)
 
 
-def cleanup_old_snapshots():
-    """Remove snapshots older than MAX_SNAPSHOT_RETENTION_DAYS."""
+def load_snapshot_diff(start=None, end=None, columns: list[str] | None = SNAPSHOT_DIFF_COLUMNS):
+    """
+    Changed, added and removed sites between two snapshots (default: the
+    last two), compared on columns; see snapshot_store.diff_snapshots.
+    None if there are none.
+    """
     _ensure_dirs()
-    cutoff = datetime.now() - timedelta(days=MAX_SNAPSHOT_RETENTION_DAYS)
-    snapshot_dir = CACHE_SNAPSHOTS_DIR
+    return diff_snapshots(start, end, columns)
 
-    for f in os.listdir(snapshot_dir):
-        if not f.endswith(".parquet"):
-            continue
-        fpath = os.path.join(snapshot_dir, f)
-        try:
-            mtime = datetime.fromtimestamp(os.path.getmtime(fpath))
-            if mtime < cutoff:
-                os.remove(fpath)
-                logger.info("Removed old snapshot: %s", fpath)
-        except Exception as exc:
-            logger.warning("Failed to remove snapshot %s: %s", f, exc)
+
+def find_snapshot(as_of) -> datetime | None:
+    """Time of the newest snapshot taken at or before as_of (None if none)."""
+    _ensure_dirs()
+    return snapshot_at(as_of)
+
+
+def load_trend_rollup(level: str = "global", **filters) -> pd.DataFrame:
+    """
+    Per-snapshot trend aggregates at "global", "package" or "district" level,
+    written alongside each snapshot (see snapshot_store.read_rollups).
+    """
+    _ensure_dirs()
+    return read_rollups(level, **filters)
+
+
+def cleanup_old_snapshots():
+    """
+    Downsample and compact old snapshots into the retention tiers (see
+    snapshot_store.compact_snapshots). Meant to run off the request path,
+    e.g. in a daemon thread after save_snapshot; failures are only logged.
+    """
+    _ensure_dirs()
+    try:
+        compact_snapshots()
+    except Exception as exc:
+        logger.warning("Snapshot retention failed: %s", exc)
 
 
 # ---------------------------------------------------------------------------
@@ -192,47 +972,52 @@ def get_data(force_refresh: bool = False):
 
     Returns (df_tasks, df_site, warnings_list)
     """
-    from transform import clean_tasks, build_site_summary
-
     warnings_list = []
+    started = time.perf_counter()
+
+    cached_tasks, cached_site = load_latest_cache()
 
     if not force_refresh:
         # Try disk cache first
-        df_tasks, df_site = load_latest_cache()
-        if df_tasks is not None and df_site is not None:
+        if cached_tasks is not None and cached_site is not None:
             ts = get_cache_timestamp()
             warnings_list.append(f"Loaded from cache ({ts})")
-            return df_tasks, df_site, warnings_list
+            # Delays in the cache may be from an earlier business date
+            cached_tasks, cached_site, _ = roll_business_date(
+                cached_tasks, cached_site, load_source_state()
+            )
+            return cached_tasks, cached_site, warnings_list
 
-    # Fresh fetch
-    df_tasks_raw, succeeded, failed = fetch_all_csvs()
+    # Fresh fetch — packages whose sheet is unchanged reuse the cached frames
+    parts, source_state, report = refresh_parts(
+        split_parts(cached_tasks, cached_site), load_source_state()
+    )
+    succeeded, failed = report["succeeded"], report["failed"]
 
     if failed:
         warnings_list.append(f"Failed to load: {', '.join(failed)}")
 
-    if df_tasks_raw.empty:
+    if not succeeded:
         # Try fallback to cache
-        df_tasks, df_site = load_latest_cache()
-        if df_tasks is not None and df_site is not None:
+        if cached_tasks is not None and cached_site is not None:
             ts = get_cache_timestamp()
             warnings_list.append(
                 f"All sources unavailable — showing cached data from {ts}"
             )
-            return df_tasks, df_site, warnings_list
+            return cached_tasks, cached_site, warnings_list
         else:
             warnings_list.append("No data available — check network and try again")
             return pd.DataFrame(), pd.DataFrame(), warnings_list
 
-    # Clean and build
-    df_tasks = clean_tasks(df_tasks_raw)
-    df_site = build_site_summary(df_tasks)
+    df_tasks, df_site = assemble_parts(parts)
 
     # Persist
-    save_latest_cache(df_tasks, df_site)
+    save_latest_cache(df_tasks, df_site, source_state, time.perf_counter() - started)
+    save_source_state(source_state)
 
     if force_refresh:
-        save_snapshot(df_site)
-        cleanup_old_snapshots()
+        save_snapshot(df_site, source_state)
+        threading.Thread(target=cleanup_old_snapshots, name="snapshot-retention", daemon=True).start()
 
     warnings_list.insert(
         0, f"Loaded {len(succeeded)}/{len(CSV_SOURCES)} sources successfully"
@@ -14,7 +14,7 @@ from charts import (
     chart_trend_progress,
     chart_trend_completed,
 )
-from loader import load_all_snapshots
+from loader import load_trend_rollup
 
 st.title("📊 Situation Room — Executive Summary")
 
@@ -102,21 +102,21 @@ else:
 st.markdown("---")
 
 # ---------------------------------------------------------------------------
-# Trend charts (from snapshots)
+# Trend charts (from snapshot rollups)
 # ---------------------------------------------------------------------------
 st.markdown("### Trends")
 
-df_snapshots = load_all_snapshots()
-if df_snapshots.empty:
+df_trend = load_trend_rollup("global")
+if df_trend.empty:
     st.info("📈 Not enough data for trends — refresh periodically to build history.")
 else:
     col_t1, col_t2 = st.columns(2)
     with col_t1:
-        fig = chart_trend_progress(df_snapshots)
+        fig = chart_trend_progress(df_trend)
         if fig:
             st.plotly_chart(fig, width="stretch")
     with col_t2:
-        fig = chart_trend_completed(df_snapshots)
+        fig = chart_trend_completed(df_trend)
         if fig:
             st.plotly_chart(fig, width="stretch")
 
@@ -0,0 +1,137 @@
+"""
+replay.py — Rebuild the snapshot history from the raw source archive.
+KP-HCIP Multi-Package Executive Dashboard
+
+Snapshots record the business date and the sha256 of every source they were
+built from (index entry "inputs"), and loader.py archives each fetched body
+under that hash. Replay re-runs the current cleaning and site-summary logic
+on those archived inputs, one snapshot per worker process, and streams the
+results, oldest first, into a fresh store that is swapped in for the
+stored history (snapshot_store.rebuild_snapshots), so a fix to cleaning or
+scoring reaches past snapshots and the trend charts.
+
+Snapshots without inputs (taken before the archive existed), outside
+--start, or whose archived files are gone are carried over as stored.
+
+    python replay.py [--start 2026-04-01] [--workers 8]
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+
+import pandas as pd
+
+from config import CSV_SOURCES, REPLAY_MAX_WORKERS
+from transform import clean_tasks, build_site_summary, compact_frame, recompute_date_columns
+from loader import assemble_parts, read_archived_source, _ensure_dirs
+from snapshot_store import list_snapshots, rebuild_snapshots
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------------------------------------------------------
+# Worker
+# ---------------------------------------------------------------------------
+
+@lru_cache(maxsize=4 * len(CSV_SOURCES))
+def _clean_source(sha256: str, business_date: str) -> tuple[pd.DataFrame, pd.DataFrame] | None:
+    """Cleaned (df_tasks, df_site) part of one archived source, as of business_date."""
+    df_raw = read_archived_source(sha256)
+    if df_raw is None or df_raw.empty:
+        return None
+    df_tasks = clean_tasks(df_raw, pd.Timestamp(business_date))
+    return compact_frame(df_tasks), compact_frame(build_site_summary(df_tasks))
+
+
+# sha256 → business date its part was first cleaned for (per worker)
+_cleaned_on: dict[str, str] = {}
+
+
+def _build_part(sha256: str, business_date: str) -> tuple[pd.DataFrame, pd.DataFrame] | None:
+    """
+    Part of one source on one business date. A body is cleaned once per
+    worker; other dates are rolled from it like refresh_parts rolls
+    unchanged sources (see roll_parts).
+    """
+    cleaned_on = _cleaned_on.setdefault(sha256, business_date)
+    part = _clean_source(sha256, cleaned_on)
+    if part is None or cleaned_on == business_date:
+        return part
+    df_tasks, df_site = recompute_date_columns(*part, pd.Timestamp(business_date))
+    return compact_frame(df_tasks), compact_frame(df_site)
+
+
+def _replay_snapshot(inputs: dict) -> pd.DataFrame | None:
+    """
+    df_site of one snapshot rebuilt from its inputs, like refresh_parts would
+    build it. None if any source is missing from the archive.
+    """
+    parts = {}
+    for name, sha256 in inputs["sources"].items():
+        part = _build_part(sha256, inputs["business_date"])
+        if part is None:
+            return None
+        parts[name] = part
+    return assemble_parts(parts)[1]
+
+
+# ---------------------------------------------------------------------------
+# Replay
+# ---------------------------------------------------------------------------
+
+def replay_snapshots(start=None, max_workers: int | None = None) -> dict:
+    """
+    Rebuild every snapshot taken at or after start (default: all) that has
+    archived inputs, then replace the stored history. Returns a report.
+    """
+    started = time.perf_counter()
+    _ensure_dirs()
+    entries = list_snapshots()
+    start = pd.Timestamp(start).to_pydatetime() if start is not None else None
+    jobs = [
+        i for i, entry in enumerate(entries)
+        if entry.get("inputs") and (start is None or entry["ts"] >= start)
+    ]
+    report = {"snapshots": len(entries), "replayed": 0, "kept": 0}
+    if not jobs:
+        logger.info("No snapshots with archived inputs to replay")
+        return report
+
+    workers = max_workers or REPLAY_MAX_WORKERS or os.cpu_count() or 1
+
+    def rebuilt(frames):
+        # Taken as workers finish; anything not replayed (None) is carried
+        # over from the stored history by rebuild_snapshots
+        replayed = set(jobs)
+        for i, entry in enumerate(entries):
+            df_site = next(frames) if i in replayed else None
+            report["replayed" if df_site is not None else "kept"] += 1
+            yield entry["ts"], df_site, entry.get("inputs")
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+        # pool.map yields in submission order, so the store is rewritten oldest first
+        report["rebuild"] = rebuild_snapshots(
+            rebuilt(pool.map(_replay_snapshot, [entries[i]["inputs"] for i in jobs]))
+        )
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    logger.info("Replayed %d of %d snapshots with %d workers (%.1fs)",
+                report["replayed"], len(entries), workers, report["seconds"])
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild snapshots from the raw source archive.")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=None,
+                        help="replay snapshots taken at or after this time (default: all)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: REPLAY_MAX_WORKERS or one per CPU)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(replay_snapshots(args.start, args.workers), indent=2, default=str))
@@ -0,0 +1,1233 @@
+"""
+snapshot_store.py — Append-only, partitioned store of df_site snapshots (for trends).
+KP-HCIP Multi-Package Executive Dashboard
+
+Snapshots are delta-encoded against the previous one:
+
+    CACHE_SNAPSHOTS_DIR/index.jsonl                                             one line per snapshot
+    CACHE_SNAPSHOTS_DIR/month=2026-10/2026-10-01T06-00-00-000000.key.parquet    full df_site
+    CACHE_SNAPSHOTS_DIR/month=2026-10/2026-10-02T06-00-00-000000.delta.parquet  changed sites
+
+Every row carries _row_hash (pd.util.hash_pandas_object of the site row);
+a snapshot stores the rows whose SITE_KEY is new or whose hash changed and
+lists removed sites in its index line. A snapshot identical to the previous
+one writes no file at all. A keyframe is written every
+SNAPSHOT_KEYFRAME_INTERVAL snapshots (or when most sites changed), so any
+snapshot is at most that many small files away from a full one.
+
+The savings come from refreshes within one business date. The delay
+columns (site_delay_days, delay_bucket, risk_score, ...) tick every
+business date for every overdue site, and they are task-level aggregates,
+so they are stored rather than recomputed on read. On a portfolio where
+most sites are overdue, the first snapshot of each date is therefore a
+keyframe. With four refreshes a day and a few sites changing between
+them, the store is about 3x smaller than full snapshots, not more.
+
+Files are sorted by SITE_KEY and written in row groups of
+SNAPSHOT_ROW_GROUP_ROWS, so the min/max statistics of each row group let a
+package or site filter skip most of a file. Readers pick files from the
+index, read only the requested columns and expand keyframes + deltas back
+to full snapshots in one vectorized pass.
+
+Per-site time series do not read snapshots either: site_history.parquet
+holds one row per site and state change (SITE_HISTORY_COLUMNS, or a
+deletion marker), sorted and clustered on SITE_KEY, so one site's history
+is a single range read found through an in-memory SITE_KEY → row range map.
+New changes go to the small site_history.tail.parquet, which compaction
+folds into the clustered file.
+
+Trend charts do not read snapshots at all: every write also appends the
+snapshot's global / package / district aggregates to CACHE_SNAPSHOTS_DIR/
+rollups.parquet (see transform.build_trend_rollup), a table of a few dozen
+rows per snapshot that is kept beyond snapshot retention.
+
+Retention is tiered (compact_snapshots, run off the request path): every
+snapshot of the last SNAPSHOT_FULL_DAYS is kept, then the last one of each
+day up to SNAPSHOT_DAILY_DAYS and the last one of each ISO week up to
+MAX_SNAPSHOT_RETENTION_DAYS. The older snapshots kept in a month are packed
+into one segment file, month=YYYY-MM/segment-<stamp>.parquet (a keyframe
+plus deltas, told apart by _snapshot_ts and sorted by SITE_KEY), so years of
+history stay a few dozen files. Writers and compaction serialize on an flock
+of CACHE_SNAPSHOTS_DIR.lock, next to the store so that it survives
+rebuild_snapshots swapping the directory.
+"""
+
+import os
+import json
+import time
+import fcntl
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config import (
+    SITE_KEY,
+    CACHE_SNAPSHOTS_DIR,
+    SNAPSHOT_ROW_GROUP_ROWS,
+    SNAPSHOT_KEYFRAME_INTERVAL,
+    SNAPSHOT_FULL_DAYS,
+    SNAPSHOT_DAILY_DAYS,
+    MAX_SNAPSHOT_RETENTION_DAYS,
+    SITE_HISTORY_COLUMNS,
+    SNAPSHOT_DIFF_COLUMNS,
+)
+from transform import build_trend_rollup, compact_frame
+
+logger = logging.getLogger(__name__)
+
+_TS_FORMAT = "%Y-%m-%dT%H-%M-%S"
+_MONTH_PREFIX = "month="
+_INDEX_FILE = "index.jsonl"
+_ROLLUP_FILE = "rollups.parquet"
+_LOCK_SUFFIX = ".lock"
+_HISTORY_FILE = "site_history.parquet"
+_HISTORY_TAIL_FILE = "site_history.tail.parquet"
+# Tail size at which compaction folds it into the clustered history file
+_HISTORY_TAIL_ROWS = 16 * SNAPSHOT_ROW_GROUP_ROWS
+_ROLLUP_KEY = ["level", "_snapshot_ts", "package_name", "district"]
+# Bookkeeping columns left out of the row hash
+_UNHASHED_COLUMNS = ("_snapshot_ts", "_row_hash")
+
+_index_checked = False
+_index_cache: tuple[tuple[int, int], list[dict], np.ndarray] | None = None
+# (store dir inode, index ts, SITE_KEY → row hash); the inode tells a rebuilt store apart
+_last_state: tuple[int, str, dict[tuple, int]] | None = None
+_rollups_checked = False
+_rollup_cache: tuple[int, pd.DataFrame] | None = None
+_history_checked = False
+# (stamp, ParquetFile, SITE_KEY → (start, stop) rows, row-group row offsets)
+_history_cache: tuple | None = None
+_history_tail_cache: tuple[tuple[int, int], pa.Table, dict] | None = None
+_history_read_lock = threading.Lock()
+
+
+# ---------------------------------------------------------------------------
+# Paths & keys
+# ---------------------------------------------------------------------------
+
+def _snapshot_file(ts: datetime, kind: str) -> str:
+    """Index-relative path of a keyframe ("key") or delta file."""
+    # Microseconds: two refreshes within one second must not share a file
+    return os.path.join(
+        f"{_MONTH_PREFIX}{ts:%Y-%m}", f"{ts.strftime(_TS_FORMAT)}-{ts:%f}.{kind}.parquet"
+    )
+
+
+def _parse_ts(filename: str) -> datetime | None:
+    """Snapshot time from a full-snapshot file name of the pre-index layout."""
+    if filename.startswith(".") or not filename.endswith(".parquet"):
+        return None
+    try:
+        return datetime.strptime(filename[: -len(".parquet")], _TS_FORMAT)
+    except ValueError:
+        return None
+
+
+def _segment_file(month: str) -> str:
+    """Index-relative path of a new segment file for a compacted month."""
+    return os.path.join(f"{_MONTH_PREFIX}{month}", f"segment-{datetime.now():%Y%m%dT%H%M%S%f}.parquet")
+
+
+def _as_datetime(value) -> datetime | None:
+    """Naive local datetime (snapshot times are naive server-local times)."""
+    if value is None:
+        return None
+    ts = pd.Timestamp(value).to_pydatetime()
+    return ts.astimezone().replace(tzinfo=None) if ts.tzinfo is not None else ts
+
+
+def _site_keys(df: pd.DataFrame) -> list[tuple]:
+    """SITE_KEY tuples with missing parts as None (hashable, JSON-safe)."""
+    keys = df[SITE_KEY].astype(object)
+    keys = keys.where(keys.notna(), None)
+    return list(zip(*(keys[col] for col in SITE_KEY)))
+
+
+def _site_key(site) -> tuple:
+    """One SITE_KEY tuple with missing parts (NaN, pd.NA, None) as None, like _site_keys."""
+    return tuple(None if pd.isna(part) else part for part in site)
+
+
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """Stable uint64 hash of each row's values (bookkeeping columns excluded)."""
+    cols = [c for c in df.columns if c not in _UNHASHED_COLUMNS]
+    return pd.util.hash_pandas_object(df[cols], index=False).to_numpy()
+
+
+# ---------------------------------------------------------------------------
+# Index
+# ---------------------------------------------------------------------------
+
+def _index_path() -> str:
+    return os.path.join(CACHE_SNAPSHOTS_DIR, _INDEX_FILE)
+
+
+def _load_index() -> tuple[list[dict], np.ndarray]:
+    """
+    Index entries (oldest first) and their times as a sorted datetime64
+    array, re-parsed only when the file changed.
+    """
+    global _index_cache
+    _ensure_index()
+    try:
+        st = os.stat(_index_path())
+    except FileNotFoundError:
+        return [], np.array([], dtype="datetime64[us]")
+    stamp = (st.st_mtime_ns, st.st_size)
+    if _index_cache is None or _index_cache[0] != stamp:
+        with open(_index_path()) as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        for entry in entries:
+            entry["ts"] = datetime.fromisoformat(entry["ts"])
+        times = np.array([entry["ts"] for entry in entries], dtype="datetime64[us]")
+        _index_cache = (stamp, entries, times)
+    return _index_cache[1], _index_cache[2]
+
+
+def _read_index() -> list[dict]:
+    """All index entries, oldest first."""
+    return _load_index()[0]
+
+
+def _index_line(entry: dict) -> str:
+    return json.dumps({**entry, "ts": entry["ts"].isoformat()}) + "\n"
+
+
+def _append_index(entry: dict):
+    with open(_index_path(), "a") as f:
+        f.write(_index_line(entry))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _rewrite_index(entries: list[dict]):
+    """Replace the whole index atomically (migration, retention)."""
+    tmp_path = os.path.join(CACHE_SNAPSHOTS_DIR, f".{_INDEX_FILE}.tmp")
+    with open(tmp_path, "w") as f:
+        f.writelines(_index_line(entry) for entry in entries)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, _index_path())
+
+
+@contextmanager
+def _locked():
+    """
+    Serialize snapshot writes and compaction (threads and processes). The
+    lock file sits outside the store directory, which rebuild_snapshots
+    replaces while holding it.
+    """
+    lock_path = f"{CACHE_SNAPSHOTS_DIR}{_LOCK_SUFFIX}"
+    os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        os.makedirs(CACHE_SNAPSHOTS_DIR, exist_ok=True)
+        yield
+    finally:
+        os.close(fd)
+
+
+# ---------------------------------------------------------------------------
+# Write
+# ---------------------------------------------------------------------------
+
+def _write_snapshot_file(df: pd.DataFrame, path: str):
+    """
+    Sort by SITE_KEY (then _snapshot_ts, for segments) and write with
+    row-group statistics on those columns (temp file + rename). The pandas
+    schema metadata is dropped: readers convert from Arrow types, and on
+    small delta files it is a third of the bytes.
+    """
+    order = [*SITE_KEY, "_snapshot_ts"]
+    df = df.sort_values(order, kind="stable", ignore_index=True)
+    table = pa.Table.from_pandas(df, preserve_index=False).replace_schema_metadata(None)
+    tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+    pq.write_table(
+        table, tmp_path,
+        row_group_size=SNAPSHOT_ROW_GROUP_ROWS,
+        write_statistics=order,
+    )
+    os.replace(tmp_path, path)
+
+
+def _diff(df: pd.DataFrame, previous: dict[tuple, int] | None) -> tuple[np.ndarray, list[list]]:
+    """Rows of df (with _row_hash) new or changed since previous, and the SITE_KEYs removed."""
+    if previous is None:
+        return np.ones(len(df), dtype=bool), []
+    keys = _site_keys(df)
+    changed = np.fromiter(
+        (previous.get(key) != int(h) for key, h in zip(keys, df["_row_hash"].to_numpy())),
+        dtype=bool, count=len(keys),
+    )
+    deleted = [list(key) for key in previous.keys() - set(keys)]
+    return changed, deleted
+
+
+def _encode_snapshot(
+    df: pd.DataFrame,
+    ts: datetime,
+    previous: dict[tuple, int] | None,
+    since_keyframe: int,
+) -> tuple[dict, pd.DataFrame | None]:
+    """
+    Index entry and the rows to store for df (which has _row_hash) relative
+    to the previous snapshot's SITE_KEY → hash map. Rows are None when the
+    snapshot is identical and nothing needs writing.
+    """
+    entry = {"ts": ts, "rows": len(df)}
+
+    if previous is not None and since_keyframe < SNAPSHOT_KEYFRAME_INTERVAL:
+        changed, deleted = _diff(df, previous)
+        if not changed.any() and not deleted:
+            return {**entry, "kind": "same", "file": None, "changed": 0, "deleted": []}, None
+        # Mostly-changed snapshots are cheaper to store (and read) whole;
+        # that includes the first one of a new business date when most
+        # sites are overdue and their delay columns tick
+        if changed.sum() * 2 <= len(df):
+            file = _snapshot_file(ts, "delta") if changed.any() else None
+            return {
+                **entry, "kind": "delta", "file": file,
+                "changed": int(changed.sum()), "deleted": deleted,
+            }, df[changed]
+    return {**entry, "kind": "key", "file": _snapshot_file(ts, "key"),
+            "changed": len(df), "deleted": []}, df
+
+
+def _store_snapshot(entry: dict, rows: pd.DataFrame | None):
+    """Write the keyframe / delta file of an encoded snapshot (if it has one)."""
+    if rows is None or not entry["file"]:
+        return
+    path = os.path.join(CACHE_SNAPSHOTS_DIR, entry["file"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _write_snapshot_file(rows, path)
+
+
+def _since_keyframe(entries: list[dict]) -> int:
+    """Snapshots written since (and including) the newest keyframe."""
+    for back, entry in enumerate(reversed(entries)):
+        if entry["kind"] == "key":
+            return back + 1
+    return SNAPSHOT_KEYFRAME_INTERVAL
+
+
+def _state(df: pd.DataFrame) -> dict[tuple, int]:
+    return dict(zip(_site_keys(df), map(int, df["_row_hash"])))
+
+
+def _previous_hashes(entries: list[dict]) -> dict[tuple, int] | None:
+    """SITE_KEY → row hash of the newest snapshot (cached after each write)."""
+    global _last_state
+    if not entries:
+        return None
+    key = (os.stat(CACHE_SNAPSHOTS_DIR).st_ino, entries[-1]["ts"].isoformat())
+    if _last_state is None or _last_state[:2] != key:
+        last = _reconstruct(entries, len(entries) - 1, len(entries) - 1,
+                            columns=[*SITE_KEY, "_row_hash"])
+        _last_state = (*key, _state(last) if not last.empty else {})
+    return _last_state[2]
+
+
+def write_snapshot(
+    df_site: pd.DataFrame,
+    ts: datetime | None = None,
+    inputs: dict | None = None,
+) -> dict:
+    """
+    Append a snapshot of df_site taken at ts (default: now) as a keyframe, a
+    delta or — if nothing changed — an index line only. inputs (business
+    date and source hashes, see replay.py) is kept in the index entry.
+    Returns its index entry.
+    """
+    global _last_state
+    ts = ts or datetime.now()
+    df = df_site.copy()
+    df["_snapshot_ts"] = ts
+    df["_row_hash"] = row_hashes(df)
+
+    with _locked():
+        _ensure_history()
+        entries = _read_index()
+        previous = _previous_hashes(entries)
+        entry, rows = _encode_snapshot(df, ts, previous, _since_keyframe(entries))
+        if inputs is not None:
+            entry["inputs"] = inputs
+        _store_snapshot(entry, rows)
+        _append_index(entry)
+        _last_state = (os.stat(CACHE_SNAPSHOTS_DIR).st_ino, ts.isoformat(), _state(df))
+        if entry["kind"] != "same":
+            _append_history(_history_rows(df, ts, *_diff(df, previous)))
+        append_rollups(build_trend_rollup(df))
+    return entry
+
+
+def _ensure_index():
+    """
+    Re-encode full-snapshot files of the older layouts (flat *.parquet, then
+    month=YYYY-MM/<ts>.parquet) as keyframes + deltas with an index. Old
+    files are removed only once the new index is in place. Checked once per
+    process.
+    """
+    global _index_checked
+    if _index_checked:
+        return
+    _index_checked = True
+    if not os.path.isdir(CACHE_SNAPSHOTS_DIR) or os.path.exists(_index_path()):
+        return
+
+    old_files = []
+    for item in os.scandir(CACHE_SNAPSHOTS_DIR):
+        if item.is_file() and _parse_ts(item.name):
+            old_files.append((_parse_ts(item.name), item.path))
+        elif item.is_dir() and item.name.startswith(_MONTH_PREFIX):
+            old_files += [(_parse_ts(f.name), f.path) for f in os.scandir(item.path) if _parse_ts(f.name)]
+    if not old_files:
+        return
+
+    entries, previous = [], None
+    for name_ts, path in sorted(old_files):
+        try:
+            df = pd.read_parquet(path)
+        except Exception as exc:
+            logger.warning("Failed to migrate snapshot %s: %s", os.path.basename(path), exc)
+            continue
+        ts = df["_snapshot_ts"].iloc[0].to_pydatetime() if "_snapshot_ts" in df and len(df) else name_ts
+        df["_snapshot_ts"] = ts
+        df["_row_hash"] = row_hashes(df)
+        entry, rows = _encode_snapshot(df, ts, previous, _since_keyframe(entries))
+        _store_snapshot(entry, rows)
+        entries.append(entry)
+        previous = _state(df)
+
+    _rewrite_index(entries)
+    for _, path in old_files:
+        os.remove(path)
+    logger.info("Re-encoded %d full snapshots as %d keyframes + deltas",
+                len(entries), sum(e["kind"] == "key" for e in entries))
+
+
+# ---------------------------------------------------------------------------
+# Read
+# ---------------------------------------------------------------------------
+
+def list_snapshots(start=None, end=None) -> list[dict]:
+    """Index entries of the snapshots taken in [start, end], oldest first."""
+    start, end = _as_datetime(start), _as_datetime(end)
+    return [
+        entry for entry in _read_index()
+        if (start is None or entry["ts"] >= start) and (end is None or entry["ts"] <= end)
+    ]
+
+
+def snapshot_at(as_of) -> datetime | None:
+    """Time of the newest snapshot taken at or before as_of (None if none)."""
+    entries, times = _load_index()
+    pos = np.searchsorted(times, np.datetime64(_as_datetime(as_of), "us"), side="right") - 1
+    return entries[pos]["ts"] if pos >= 0 else None
+
+
+def _row_group_filter(packages, sites) -> dict[str, set]:
+    """Column → accepted values, checked against row-group min/max statistics."""
+    wanted: dict[str, set] = {}
+    if packages:
+        wanted["package_name"] = set(packages)
+    if sites:
+        for pos, col in enumerate(SITE_KEY):
+            values = {site[pos] for site in sites}
+            wanted[col] = wanted[col] & values if col in wanted else values
+    return wanted
+
+
+def _matching_row_groups(metadata: pq.FileMetaData, wanted: dict[str, set]) -> list[int]:
+    """Row groups whose statistics admit at least one wanted value per column."""
+    if not wanted:
+        return list(range(metadata.num_row_groups))
+    positions = {
+        metadata.schema.column(i).name: i
+        for i in range(metadata.num_columns)
+        if metadata.schema.column(i).name in wanted
+    }
+    groups = []
+    for rg in range(metadata.num_row_groups):
+        row_group = metadata.row_group(rg)
+        for col, values in wanted.items():
+            if col not in positions:
+                continue
+            stats = row_group.column(positions[col]).statistics
+            if stats is None or not stats.has_min_max:
+                continue
+            if not any(v is not None and stats.min <= v <= stats.max for v in values):
+                break
+        else:
+            groups.append(rg)
+    return groups
+
+
+def _read_snapshot_file(path: str, wanted: dict[str, set], columns: list[str] | None) -> pa.Table | None:
+    """Matching row groups of one file (None if no row group can match)."""
+    pf = pq.ParquetFile(path, memory_map=True)
+    groups = _matching_row_groups(pf.metadata, wanted)
+    if not groups:
+        return None
+    names = pf.schema_arrow.names
+    cols = [c for c in columns if c in names] if columns is not None else None
+    return pf.read_row_groups(groups, columns=cols, use_pandas_metadata=False)
+
+
+def _reconstruct(
+    entries: list[dict],
+    lo: int,
+    hi: int,
+    packages: list[str] | None = None,
+    sites: list[tuple] | None = None,
+    columns: list[str] | None = None,
+    with_hash: bool = False,
+    root: str | None = None,
+) -> pd.DataFrame:
+    """
+    Full rows of snapshots entries[lo..hi]: read the keyframe at or before lo
+    and the deltas after it, then give every stored row the run of snapshots
+    it is valid for (until its site changes, is deleted or a keyframe
+    follows) and repeat it that many times. _row_hash is dropped unless
+    with_hash or asked for in columns. Files are read from root (default
+    CACHE_SNAPSHOTS_DIR).
+    """
+    base = max((i for i in range(lo + 1) if entries[i]["kind"] == "key"), default=0)
+    span = entries[base:hi + 1]
+    times = np.array([e["ts"] for e in span], dtype="datetime64[us]")
+    wanted = _row_group_filter(packages, sites)
+    read_columns = None
+    if columns is not None:
+        read_columns = list(dict.fromkeys([*columns, *SITE_KEY, *wanted, "_snapshot_ts"]))
+
+    files: dict[str, list[int]] = {}
+    deleted_keys, deleted_seqs = [], []
+    for seq, entry in enumerate(span):
+        for key in entry["deleted"]:
+            key = tuple(key)
+            if (not packages or key[0] in packages) and (not sites or key in sites):
+                deleted_keys.append(key)
+                deleted_seqs.append(seq)
+        if entry["file"]:
+            files.setdefault(entry["file"], []).append(seq)
+
+    # A segment holds several snapshots: read it once and give each row the
+    # seq of the span snapshot its _snapshot_ts belongs to (rows of snapshots
+    # outside the span are dropped)
+    tables, seqs = [], []
+    for file, file_seqs in files.items():
+        try:
+            table = _read_snapshot_file(os.path.join(root or CACHE_SNAPSHOTS_DIR, file), wanted, read_columns)
+        except Exception as exc:
+            logger.warning("Failed to load snapshot %s: %s", file, exc)
+            continue
+        if table is None or not table.num_rows:
+            continue
+        if not span[file_seqs[0]].get("packed"):
+            seqs.append(np.full(table.num_rows, file_seqs[0]))
+        else:
+            row_ts = table.column("_snapshot_ts").cast(pa.timestamp("us")).to_numpy()
+            file_times = times[file_seqs]
+            pos = np.minimum(np.searchsorted(file_times, row_ts), len(file_seqs) - 1)
+            hit = file_times[pos] == row_ts
+            table = table.filter(pa.array(hit))
+            seqs.append(np.asarray(file_seqs)[pos[hit]])
+        tables.append(table)
+    if not tables:
+        return pd.DataFrame()
+
+    # One conversion for the whole span; schemas of old files are promoted
+    data = pa.concat_tables(tables, promote_options="permissive").to_pandas()
+    seq = np.concatenate(seqs)
+    keep = np.ones(len(data), dtype=bool)
+    for col, values in wanted.items():
+        keep &= data[col].isin(values).to_numpy()
+    if sites:
+        keep &= pd.MultiIndex.from_frame(data[SITE_KEY].astype(object)).isin(list(sites))
+    data, seq = data[keep].reset_index(drop=True), seq[keep]
+
+    # Stored rows and deletion markers, ordered by site and then snapshot
+    keys = pd.concat([
+        data[SITE_KEY].astype(object),
+        pd.DataFrame(deleted_keys, columns=SITE_KEY, dtype=object),
+    ], ignore_index=True)
+    site = keys.groupby(SITE_KEY, dropna=False, sort=True).ngroup().to_numpy()
+    seq = np.concatenate([seq, np.asarray(deleted_seqs, dtype=seq.dtype)])
+    row = np.concatenate([np.arange(len(data)), np.full(len(deleted_keys), -1)])
+    order = np.lexsort((seq, site))
+    site, seq, row = site[order], seq[order], row[order]
+
+    # A row is valid until the next row of its site or the next keyframe
+    n = len(span)
+    end = np.full(len(seq), n)
+    same_site = site[1:] == site[:-1]
+    end[:-1][same_site] = seq[1:][same_site]
+    keyframes = np.array([i for i, e in enumerate(span) if e["kind"] == "key"] + [n])
+    end = np.minimum(end, keyframes[np.searchsorted(keyframes, seq, side="right")])
+
+    first = np.maximum(seq, lo - base)
+    count = np.clip(np.minimum(end, hi - base + 1) - first, 0, None)
+    count[row < 0] = 0
+    rows = np.repeat(row, count)
+    snap = np.repeat(first, count) + np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    # Stable: sites stay in SITE_KEY order within each snapshot
+    by_snapshot = np.argsort(snap, kind="stable")
+    rows, snap = rows[by_snapshot], snap[by_snapshot]
+
+    df = data.iloc[rows].reset_index(drop=True)
+    df["_snapshot_ts"] = times[snap]
+    if columns is not None:
+        df = df[[c for c in dict.fromkeys([*columns, "_snapshot_ts"]) if c in df.columns]]
+    elif "_row_hash" in df.columns and not with_hash:
+        df = df.drop(columns="_row_hash")
+    # Same category order as concat_frames would produce
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].cat.reorder_categories(df[col].cat.categories.sort_values())
+    return compact_frame(df)
+
+
+def read_snapshots(
+    start=None,
+    end=None,
+    packages: list[str] | None = None,
+    sites: list[tuple] | None = None,
+    columns: list[str] | None = None,
+    consistent: bool = False,
+) -> pd.DataFrame:
+    """
+    Full snapshot rows in the time range [start, end], optionally limited to
+    some packages or to SITE_KEY tuples, reading only `columns` (plus
+    _snapshot_ts). Returns an empty DataFrame if nothing matches.
+    consistent reads under the store lock, so compaction cannot remove files
+    mid-read (otherwise their rows are skipped with a warning); use it for
+    results that are cached.
+    """
+    if consistent:
+        with _locked():
+            return read_snapshots(start, end, packages, sites, columns)
+    entries, times = _load_index()
+    lo, hi = 0, len(entries) - 1
+    if start is not None:
+        lo = int(np.searchsorted(times, np.datetime64(_as_datetime(start), "us"), side="left"))
+    if end is not None:
+        hi = int(np.searchsorted(times, np.datetime64(_as_datetime(end), "us"), side="right")) - 1
+    if lo > hi:
+        return pd.DataFrame()
+    return _reconstruct(entries, lo, hi, packages, sites, columns)
+
+
+def diff_snapshots(
+    start=None,
+    end=None,
+    columns: list[str] | None = SNAPSHOT_DIFF_COLUMNS,
+) -> tuple[datetime, datetime, pd.DataFrame] | None:
+    """
+    What changed between the snapshots in effect at start and at end
+    (default: the newest one and the one before it). Sites are matched on a
+    hash of SITE_KEY and compared by _row_hash; only rows whose hash changed
+    are compared on columns (None: every column), so a site whose other
+    columns changed is not reported. Returns (from time, to time, changes)
+    with one changes row per changed column (change="changed", SITE_KEY,
+    column, from, to) and one per added or removed site (column, from and
+    to empty); None without a snapshot that old.
+    """
+    entries, times = _load_index()
+    if not entries:
+        return None
+    hi = len(entries) - 1 if end is None else int(np.searchsorted(
+        times, np.datetime64(_as_datetime(end), "us"), side="right")) - 1
+    lo = hi - 1 if start is None else int(np.searchsorted(
+        times, np.datetime64(_as_datetime(start), "us"), side="right")) - 1
+    if hi < 0 or lo < 0:
+        return None
+    read_columns = [*SITE_KEY, *columns, "_row_hash"] if columns is not None else None
+    columns = ["change", *SITE_KEY, "column", "from", "to"]
+    old = _reconstruct(entries, lo, lo, columns=read_columns, with_hash=True) if lo != hi else pd.DataFrame()
+    new = _reconstruct(entries, hi, hi, columns=read_columns, with_hash=True) if lo != hi else pd.DataFrame()
+    if old.empty and new.empty:
+        return entries[lo]["ts"], entries[hi]["ts"], pd.DataFrame(columns=columns)
+
+    def site_ids(df):
+        if df.empty:
+            return pd.Index([], dtype="uint64")
+        return pd.Index(pd.util.hash_pandas_object(df[SITE_KEY].astype(object), index=False))
+
+    old_ids, new_ids = site_ids(old), site_ids(new)
+    match = old_ids.get_indexer(new_ids)          # new row → old row, -1 if added
+    paired = np.flatnonzero(match >= 0)
+    changed = paired[old["_row_hash"].to_numpy()[match[paired]] != new["_row_hash"].to_numpy()[paired]] \
+        if len(paired) else paired
+
+    frames = []
+    added = new.iloc[np.flatnonzero(match < 0)]
+    removed = old.iloc[np.flatnonzero(~old_ids.isin(new_ids))] if len(old) else old
+    for change, rows in (("added", added), ("removed", removed)):
+        if len(rows):
+            frames.append(rows[SITE_KEY].astype(object).assign(change=change))
+    if len(changed):
+        a = old.iloc[match[changed]].reset_index(drop=True)
+        b = new.iloc[changed].reset_index(drop=True)
+        keys = b[SITE_KEY].astype(object)
+        for col in dict.fromkeys([*a.columns, *b.columns]):
+            if col in (*SITE_KEY, "_snapshot_ts", "_row_hash"):
+                continue
+            va = a[col].astype(object) if col in a else pd.Series(None, index=a.index, dtype=object)
+            vb = b[col].astype(object) if col in b else pd.Series(None, index=b.index, dtype=object)
+            differs = ~((va == vb) | (va.isna() & vb.isna()))
+            if differs.any():
+                frames.append(keys[differs].assign(
+                    change="changed", column=col, **{"from": va[differs], "to": vb[differs]}
+                ))
+
+    if not frames:
+        return entries[lo]["ts"], entries[hi]["ts"], pd.DataFrame(columns=columns)
+    changes = pd.concat(frames, ignore_index=True).reindex(columns=columns)
+    changes = changes.sort_values(SITE_KEY, kind="stable", ignore_index=True)
+    return entries[lo]["ts"], entries[hi]["ts"], changes
+
+
+# ---------------------------------------------------------------------------
+# Trend rollups
+# ---------------------------------------------------------------------------
+
+def _rollup_path() -> str:
+    return os.path.join(CACHE_SNAPSHOTS_DIR, _ROLLUP_FILE)
+
+
+def _read_rollup_file() -> pd.DataFrame:
+    """The rollup table, re-read only when the file changed."""
+    global _rollup_cache
+    try:
+        mtime = os.stat(_rollup_path()).st_mtime_ns
+    except FileNotFoundError:
+        return pd.DataFrame()
+    if _rollup_cache is None or _rollup_cache[0] != mtime:
+        _rollup_cache = (mtime, pd.read_parquet(_rollup_path()))
+    return _rollup_cache[1]
+
+
+def append_rollups(rows: pd.DataFrame):
+    """Merge rollup rows into the rollup table (a rewrite of a small file)."""
+    if rows.empty:
+        return
+    os.makedirs(CACHE_SNAPSHOTS_DIR, exist_ok=True)
+    rows = rows.astype({"package_name": object, "district": object})
+    current = _read_rollup_file()
+    if not current.empty:
+        rows = pd.concat([current.astype({"package_name": object, "district": object}), rows],
+                         ignore_index=True)
+    rows = (
+        rows.drop_duplicates(_ROLLUP_KEY, keep="last")
+        .sort_values(["_snapshot_ts", "level"], kind="stable", ignore_index=True)
+    )
+    tmp_path = os.path.join(CACHE_SNAPSHOTS_DIR, f".{_ROLLUP_FILE}.tmp")
+    rows.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, _rollup_path())
+
+
+def backfill_rollups() -> int:
+    """
+    Add rollup rows for snapshots that have none (written before rollups
+    existed). Checked once per process. Returns snapshots backfilled.
+    """
+    global _rollups_checked
+    if _rollups_checked:
+        return 0
+    _rollups_checked = True
+
+    current = _read_rollup_file()
+    known = set(current["_snapshot_ts"]) if not current.empty else set()
+    entries = _read_index()
+    missing = [i for i, entry in enumerate(entries) if pd.Timestamp(entry["ts"]) not in known]
+    if not missing:
+        return 0
+    df = _reconstruct(
+        entries, missing[0], missing[-1],
+        columns=["package_name", "district", "site_progress", "risk_score",
+                 "delay_bucket", "site_status"],
+    )
+    df = df[df["_snapshot_ts"].isin([entries[i]["ts"] for i in missing])]
+    append_rollups(build_trend_rollup(df))
+    logger.info("Backfilled trend rollups for %d snapshots", len(missing))
+    return len(missing)
+
+
+def read_rollups(
+    level: str = "global",
+    start=None,
+    end=None,
+    packages: list[str] | None = None,
+) -> pd.DataFrame:
+    """
+    Trend rollup rows of one level ("global", "package" or "district"),
+    oldest first, optionally limited to a time range and packages.
+    """
+    backfill_rollups()
+    df = _read_rollup_file()
+    if df.empty:
+        return df
+    mask = df["level"] == level
+    if start is not None:
+        mask &= df["_snapshot_ts"] >= _as_datetime(start)
+    if end is not None:
+        mask &= df["_snapshot_ts"] <= _as_datetime(end)
+    if packages:
+        mask &= df["package_name"].isin(packages)
+    return compact_frame(df[mask].reset_index(drop=True))
+
+
+# ---------------------------------------------------------------------------
+# Site history
+# ---------------------------------------------------------------------------
+
+def _history_path(tail: bool = False) -> str:
+    return os.path.join(CACHE_SNAPSHOTS_DIR, _HISTORY_TAIL_FILE if tail else _HISTORY_FILE)
+
+
+def _history_columns(df: pd.DataFrame) -> list[str]:
+    return [*SITE_KEY, *(c for c in SITE_HISTORY_COLUMNS if c in df.columns)]
+
+
+def _history_rows(df: pd.DataFrame, ts: datetime, changed: np.ndarray, deleted: list[list]) -> pd.DataFrame:
+    """History rows started by one snapshot: its changed rows plus deletion markers."""
+    rows = df.loc[changed, _history_columns(df)].assign(_snapshot_ts=ts, _deleted=False)
+    if deleted:
+        markers = pd.DataFrame(deleted, columns=SITE_KEY, dtype=object)
+        rows = pd.concat([rows, markers.assign(_snapshot_ts=ts, _deleted=True)], ignore_index=True)
+    return rows
+
+
+def _history_runs(df: pd.DataFrame, times: np.ndarray) -> pd.DataFrame:
+    """
+    History rows of full snapshots (with _row_hash): a row wherever a site
+    appears or its hash changes, a deletion marker wherever it disappears.
+    """
+    seq = np.searchsorted(times, df["_snapshot_ts"].to_numpy().astype("datetime64[us]"))
+    site = df.groupby(SITE_KEY, dropna=False, sort=False, observed=True).ngroup().to_numpy()
+    order = np.lexsort((seq, site))
+    df, seq, site = df.iloc[order], seq[order], site[order]
+    hashes = df["_row_hash"].to_numpy()
+
+    # follows: the row is its site's row in the snapshot right after the previous row's
+    follows = np.r_[False, (site[1:] == site[:-1]) & (seq[1:] == seq[:-1] + 1)]
+    starts = ~follows | np.r_[True, hashes[1:] != hashes[:-1]]
+    ends = np.r_[~follows[1:], True] & (seq + 1 < len(times))
+
+    runs = df[_history_columns(df)].iloc[np.flatnonzero(starts)]
+    markers = df[SITE_KEY].iloc[np.flatnonzero(ends)]
+    return pd.concat([
+        runs.assign(_snapshot_ts=times[seq[starts]], _deleted=False),
+        markers.astype(object).assign(_snapshot_ts=times[seq[ends] + 1], _deleted=True),
+    ], ignore_index=True)
+
+
+def _prune_history(runs: pd.DataFrame, times: np.ndarray) -> pd.DataFrame:
+    """Drop rows in effect at none of the snapshot times (each site's last row stays)."""
+    runs = runs.sort_values([*SITE_KEY, "_snapshot_ts"], kind="stable", ignore_index=True)
+    site = runs.groupby(SITE_KEY, dropna=False, sort=False, observed=True).ngroup().to_numpy()
+    start = runs["_snapshot_ts"].to_numpy().astype("datetime64[us]")
+    last = np.r_[site[1:] != site[:-1], True]
+    next_start = np.r_[start[1:], start[-1:]]
+    first = np.searchsorted(times, start, side="left")
+    in_effect = first < len(times)
+    in_effect[in_effect] = times[first[in_effect]] < next_start[in_effect]
+    return runs[in_effect | last].reset_index(drop=True)
+
+
+def _ensure_history():
+    """
+    Build the site history from the stored snapshots if there is none yet
+    (stores written before it existed). Checked once per process; the
+    caller holds _locked().
+    """
+    global _history_checked
+    if _history_checked:
+        return
+    _history_checked = True
+    if os.path.exists(_history_path()) or os.path.exists(_history_path(tail=True)):
+        return
+    entries, times = _load_index()
+    if not entries:
+        return
+    df = _reconstruct(entries, 0, len(entries) - 1,
+                      columns=[*SITE_KEY, *SITE_HISTORY_COLUMNS, "_row_hash"])
+    if df.empty:
+        return
+    runs = _history_runs(df, times)
+    _write_snapshot_file(runs, _history_path())
+    logger.info("Built site history from %d snapshots (%d rows)", len(entries), len(runs))
+
+
+def _read_history_tail() -> tuple[pa.Table | None, dict]:
+    """Tail rows and SITE_KEY → their positions, re-read only when the file changed."""
+    global _history_tail_cache
+    try:
+        st = os.stat(_history_path(tail=True))
+    except FileNotFoundError:
+        return None, {}
+    stamp = (st.st_mtime_ns, st.st_size)
+    if _history_tail_cache is None or _history_tail_cache[0] != stamp:
+        table = pq.read_table(_history_path(tail=True))
+        keys = table.select(SITE_KEY).to_pandas()
+        groups = keys.groupby(SITE_KEY, dropna=False, sort=False, observed=True).indices
+        rows = {_site_key(key): positions for key, positions in groups.items()}
+        _history_tail_cache = (stamp, table, rows)
+    return _history_tail_cache[1], _history_tail_cache[2]
+
+
+def _append_history(rows: pd.DataFrame):
+    """Add history rows to the tail (a rewrite of a small file)."""
+    if rows.empty:
+        return
+    tail, _ = _read_history_tail()
+    if tail is not None:
+        rows = pd.concat([tail.to_pandas(), rows], ignore_index=True)
+    tmp_path = os.path.join(CACHE_SNAPSHOTS_DIR, f".{_HISTORY_TAIL_FILE}.tmp")
+    rows.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, _history_path(tail=True))
+
+
+def _merge_history(prune: bool) -> bool:
+    """
+    Fold the tail into the clustered history file, dropping rows no kept
+    snapshot needs. Runs when snapshots were compacted (prune) or the tail
+    has grown past _HISTORY_TAIL_ROWS. Caller holds _locked().
+    """
+    tail, _ = _read_history_tail()
+    if not prune and (tail is None or tail.num_rows < _HISTORY_TAIL_ROWS):
+        return False
+    frames = [tail.to_pandas()] if tail is not None else []
+    if os.path.exists(_history_path()):
+        frames.insert(0, pd.read_parquet(_history_path()))
+    if not frames:
+        return False
+    runs = _prune_history(pd.concat(frames, ignore_index=True), _load_index()[1])
+    _write_snapshot_file(runs, _history_path())
+    if tail is not None:
+        os.remove(_history_path(tail=True))
+    return True
+
+
+def _read_history_file() -> tuple | None:
+    """(ParquetFile, SITE_KEY → (start, stop), row-group offsets) of the clustered file."""
+    global _history_cache
+    try:
+        st = os.stat(_history_path())
+    except FileNotFoundError:
+        return None
+    stamp = (st.st_mtime_ns, st.st_size)
+    if _history_cache is None or _history_cache[0] != stamp:
+        pf = pq.ParquetFile(_history_path(), memory_map=True)
+        keys = pf.read(columns=SITE_KEY, use_pandas_metadata=False).to_pandas()
+        site = keys.groupby(SITE_KEY, dropna=False, sort=False, observed=True).ngroup().to_numpy()
+        starts = np.flatnonzero(np.r_[True, site[1:] != site[:-1]]) if len(site) else site
+        stops = np.r_[starts[1:], len(site)]
+        ranges = dict(zip(_site_keys(keys.iloc[starts]), zip(starts.tolist(), stops.tolist())))
+        offsets = np.cumsum([0] + [pf.metadata.row_group(i).num_rows for i in range(pf.num_row_groups)])
+        _history_cache = (stamp, pf, ranges, offsets)
+    return _history_cache[1:]
+
+
+def _site_runs(site: tuple) -> pa.Table | None:
+    """All history rows of one site, oldest first: a range read of the clustered file plus the tail."""
+    site = _site_key(site)
+    tables = []
+    cached = _read_history_file()
+    if cached is not None and site in cached[1]:
+        pf, ranges, offsets = cached
+        start, stop = ranges[site]
+        first = int(np.searchsorted(offsets, start, side="right")) - 1
+        last = int(np.searchsorted(offsets, stop - 1, side="right")) - 1
+        with _history_read_lock:
+            table = pf.read_row_groups(range(first, last + 1), use_pandas_metadata=False)
+        tables.append(table.slice(start - offsets[first], stop - start))
+    tail, rows = _read_history_tail()
+    if site in rows:
+        tables.append(tail.take(rows[site]))
+    if not tables:
+        return None
+    return pa.concat_tables(tables, promote_options="permissive").sort_by("_snapshot_ts")
+
+
+def read_site_history(site: tuple, start=None, end=None) -> pd.DataFrame:
+    """
+    SITE_HISTORY_COLUMNS of one site (a SITE_KEY tuple; any missing part
+    — None, NaN or pd.NA — matches a null one) at every snapshot in
+    [start, end] that has it, oldest first. Empty if the site is unknown.
+    """
+    if not _history_checked:
+        with _locked():
+            _ensure_history()
+    runs = _site_runs(tuple(site))
+    if runs is None:
+        return pd.DataFrame()
+
+    times = _load_index()[1]
+    if start is not None:
+        times = times[times >= np.datetime64(_as_datetime(start), "us")]
+    if end is not None:
+        times = times[times <= np.datetime64(_as_datetime(end), "us")]
+    run_ts = runs.column("_snapshot_ts").cast(pa.timestamp("us")).to_numpy()
+    pos = np.searchsorted(run_ts, times, side="right") - 1
+    present = pos >= 0
+    present[present] = ~runs.column("_deleted").to_numpy()[pos[present]]
+
+    # Expand in Arrow and convert once: the result is small, pandas overhead is not
+    table = runs.take(pos[present]).drop_columns(["_snapshot_ts", "_deleted"])
+    return table.append_column("_snapshot_ts", pa.array(times[present])).to_pandas()
+
+
+# ---------------------------------------------------------------------------
+# Retention
+# ---------------------------------------------------------------------------
+
+def _retention_keep(entries: list[dict], now: datetime) -> list[bool]:
+    """Whether each entry survives the full / daily / weekly retention tiers."""
+    full_cut = now - timedelta(days=SNAPSHOT_FULL_DAYS)
+    daily_cut = now - timedelta(days=SNAPSHOT_DAILY_DAYS)
+    oldest = now - timedelta(days=MAX_SNAPSHOT_RETENTION_DAYS)
+    last_of_day, last_of_week = {}, {}
+    for i, entry in enumerate(entries):
+        last_of_day[entry["ts"].date()] = i
+        last_of_week[entry["ts"].isocalendar()[:2]] = i
+
+    keep = []
+    for i, entry in enumerate(entries):
+        ts = entry["ts"]
+        if ts >= full_cut:
+            keep.append(True)
+        elif ts >= daily_cut:
+            keep.append(last_of_day[ts.date()] == i)
+        elif ts >= oldest:
+            keep.append(last_of_week[ts.isocalendar()[:2]] == i)
+        else:
+            keep.append(False)
+    return keep
+
+
+def _remove_files(files) -> int:
+    """Delete index-relative snapshot files and the month partitions they empty."""
+    removed = 0
+    months = set()
+    for file in files:
+        path = os.path.join(CACHE_SNAPSHOTS_DIR, file)
+        months.add(os.path.dirname(path))
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as exc:
+            logger.warning("Failed to remove snapshot %s: %s", file, exc)
+    for month in months:
+        if os.path.isdir(month) and not os.listdir(month):
+            os.rmdir(month)
+    return removed
+
+
+def _rekey(entries: list[dict], pos: int) -> dict:
+    """Write snapshot entries[pos] as a keyframe and return its new entry."""
+    entry = entries[pos]
+    full = _reconstruct(entries, pos, pos, with_hash=True)
+    rekeyed = {**entry, "kind": "key", "file": _snapshot_file(entry["ts"], "key"),
+               "changed": len(full), "deleted": []}
+    rekeyed.pop("packed", None)
+    _store_snapshot(rekeyed, full)
+    return rekeyed
+
+
+def _pack_month(entries: list[dict], positions: list[int], month: str) -> list[dict]:
+    """
+    Re-encode the snapshots entries[positions] (one month, oldest first) as a
+    keyframe + deltas in a single segment file. Returns their new entries.
+    """
+    full = _reconstruct(entries, positions[0], positions[-1], with_hash=True)
+    file = _segment_file(month)
+    packed, parts, previous = [], [], None
+    for pos in positions:
+        df = full[full["_snapshot_ts"] == entries[pos]["ts"]]
+        entry, rows = _encode_snapshot(df, entries[pos]["ts"], previous, _since_keyframe(packed))
+        entry = {**entry, "file": file if entry["file"] else None, "packed": True}
+        if "inputs" in entries[pos]:
+            entry["inputs"] = entries[pos]["inputs"]
+        if entry["file"]:
+            parts.append(rows)
+        packed.append(entry)
+        previous = _state(df)
+
+    if parts:
+        path = os.path.join(CACHE_SNAPSHOTS_DIR, file)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_snapshot_file(pd.concat(parts, ignore_index=True), path)
+    return packed
+
+
+def compact_snapshots(now: datetime | None = None) -> dict:
+    """
+    Apply the retention tiers. Only months holding snapshots older than
+    SNAPSHOT_FULL_DAYS that are still loose files or have just fallen out of
+    their tier are rewritten (as one segment each), so the cost follows the
+    files to compact, not the size of the history. A snapshot whose
+    predecessor was dropped becomes a keyframe. Returns a report.
+    """
+    started = time.perf_counter()
+    now = now or datetime.now()
+    full_cut = now - timedelta(days=SNAPSHOT_FULL_DAYS)
+    report = {"months": [], "dropped": 0, "segments": 0, "files_removed": 0}
+
+    with _locked():
+        _ensure_history()
+        entries = _read_index()
+        keep = _retention_keep(entries, now)
+        month_of = [f"{entry['ts']:%Y-%m}" for entry in entries]
+        months = sorted({
+            month_of[i] for i, entry in enumerate(entries)
+            if entry["ts"] < full_cut and (not keep[i] or not entry.get("packed"))
+        })
+        if months:
+            replaced, packed = set(), []
+            for month in months:
+                positions = [
+                    i for i, entry in enumerate(entries)
+                    if month_of[i] == month and entry["ts"] < full_cut
+                ]
+                replaced.update(positions)
+                kept = [i for i in positions if keep[i]]
+                report["dropped"] += len(positions) - len(kept)
+                if kept:
+                    packed += _pack_month(entries, kept, month)
+                    report["segments"] += 1
+
+            new_entries = sorted(
+                [entry for i, entry in enumerate(entries) if i not in replaced] + packed,
+                key=lambda entry: entry["ts"],
+            )
+            # Loose deltas / unchanged entries that now follow a different
+            # snapshot than they were encoded against
+            position = {entry["ts"]: i for i, entry in enumerate(entries)}
+            for n, entry in enumerate(new_entries):
+                if entry.get("packed") or entry["kind"] == "key":
+                    continue
+                pos = position[entry["ts"]]
+                before = new_entries[n - 1]["ts"] if n else None
+                if before != (entries[pos - 1]["ts"] if pos else None):
+                    new_entries[n] = _rekey(entries, pos)
+
+            _rewrite_index(new_entries)
+            obsolete = {e["file"] for e in entries if e["file"]} - {e["file"] for e in new_entries if e["file"]}
+            report["files_removed"] = _remove_files(obsolete)
+            report["months"] = months
+        report["history_merged"] = _merge_history(prune=bool(months))
+
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    if months:
+        logger.info("Compacted snapshots of %s: %d dropped, %d segments, %d files removed (%.2fs)",
+                    ", ".join(months), report["dropped"], report["segments"],
+                    report["files_removed"], report["seconds"])
+    return report
+
+
+# ---------------------------------------------------------------------------
+# Rebuild
+# ---------------------------------------------------------------------------
+
+def _reset_caches():
+    global _index_checked, _index_cache, _last_state, _rollups_checked, _rollup_cache
+    global _history_checked, _history_cache, _history_tail_cache
+    _index_checked, _index_cache, _last_state = False, None, None
+    _rollups_checked, _rollup_cache = False, None
+    _history_checked, _history_cache, _history_tail_cache = False, None, None
+
+
+@contextmanager
+def _store_at(directory: str):
+    """
+    Point this module at another store directory for the duration. Changes
+    module state for the whole process, so for maintenance commands only.
+    """
+    global CACHE_SNAPSHOTS_DIR
+    live = CACHE_SNAPSHOTS_DIR
+    _reset_caches()
+    CACHE_SNAPSHOTS_DIR = directory
+    try:
+        yield
+    finally:
+        CACHE_SNAPSHOTS_DIR = live
+        _reset_caches()
+
+
+def rebuild_snapshots(snapshots: Iterable[tuple[datetime, pd.DataFrame | None, dict | None]]) -> dict:
+    """
+    Replace the whole history with snapshots — (ts, df_site, inputs), oldest
+    first, consumed one at a time — written as a fresh store next to the
+    live one and swapped in under the lock. A df_site of None keeps the live
+    store's snapshot at ts (skipped if it has none). Snapshots the live store
+    took in the meantime are carried over, as are rollups of snapshots
+    retention already dropped; the new store is compacted before the swap.
+    Returns a report.
+    """
+    started = time.perf_counter()
+    live = CACHE_SNAPSHOTS_DIR
+    build, old = f"{live}.rebuild", f"{live}.old"
+    shutil.rmtree(build, ignore_errors=True)
+    report = {"written": 0, "carried": 0}
+    live_entries, live_times = _load_index()
+
+    last = None
+    with _store_at(build):
+        for ts, df_site, inputs in snapshots:
+            if df_site is None:
+                pos = int(np.searchsorted(live_times, np.datetime64(ts, "us")))
+                if pos == len(live_entries) or live_entries[pos]["ts"] != ts:
+                    continue
+                df_site = _reconstruct(live_entries, pos, pos, root=live).drop(columns="_snapshot_ts")
+            write_snapshot(df_site, ts, inputs)
+            report["written"] += 1
+            last = ts
+
+    with _locked():
+        entries = _read_index()
+        newer = [
+            (entry["ts"], _reconstruct(entries, i, i).drop(columns="_snapshot_ts"), entry.get("inputs"))
+            for i, entry in enumerate(entries)
+            if last is None or entry["ts"] > last
+        ]
+        rollups = _read_rollup_file()
+        with _store_at(build):
+            for ts, df_site, inputs in newer:
+                write_snapshot(df_site, ts, inputs)
+            report["carried"] = len(newer)
+            if not rollups.empty:
+                rebuilt = _read_rollup_file()
+                known = set(rebuilt["_snapshot_ts"]) if not rebuilt.empty else set()
+                append_rollups(rollups[~rollups["_snapshot_ts"].isin(known)])
+            report["compaction"] = compact_snapshots()
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.isdir(live):
+            os.rename(live, old)
+        os.rename(build, live)
+    shutil.rmtree(old, ignore_errors=True)
+    try:
+        os.remove(f"{build}{_LOCK_SUFFIX}")
+    except FileNotFoundError:
+        pass
+
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    logger.info("Rebuilt snapshot store: %d written, %d carried over (%.2fs)",
+                report["written"], report["carried"], report["seconds"])
+    return report
+
+
+if __name__ == "__main__":
+    # Maintenance entry point: python snapshot_store.py
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(compact_snapshots(), indent=2))
@@ -23,6 +23,8 @@ from config import (
     PROGRESS_SCORE_BRACKETS,
     MOBILIZATION_PENALTY,
     TIMEZONE,
+    COMPACT_FRAMES,
+    COMPACT_CATEGORY_COLUMNS,
 )
 
 logger = logging.getLogger(__name__)
@@ -34,7 +36,8 @@ logger = logging.getLogger(__name__)
 def _parse_dates(df: pd.DataFrame) -> pd.DataFrame:
     """§8.1 — Parse DD/MM/YYYY date columns with dayfirst=True."""
     for col in DATE_COLUMNS:
-        if col in df.columns:
+        # The pyarrow loader path already delivers typed timestamps
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
             df[col] = pd.to_datetime(df[col], dayfirst=True, errors="coerce")
     # Validation warnings
     if "actual_start" in df.columns and "actual_finish" in df.columns:
@@ -54,10 +57,34 @@ def _parse_dates(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+def _map_unique(series: pd.Series, func) -> np.ndarray:
+    """
+    Apply a scalar normalizer once per distinct value and broadcast the
+    results back through the factorized codes. These columns hold only a
+    handful of distinct values, so the cost is independent of row count.
+    """
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    mapped = np.empty(len(uniques), dtype=object)
+    mapped[:] = [func(v) for v in uniques]
+    return mapped[codes]
+
+
+def _yes_no(val) -> str:
+    v = str(val).strip().lower()
+    return "Yes" if v == "yes" else ("No" if v == "no" else "Unknown")
+
+
 def _normalize_yes_no(series: pd.Series) -> pd.Series:
     """§8.2 — Normalize Yes/No fields."""
-    s = series.astype(str).str.strip().str.lower()
-    return s.map(lambda x: "Yes" if x == "yes" else ("No" if x == "no" else "Unknown"))
+    return pd.Series(_map_unique(series, _yes_no), index=series.index)
+
+
+def _split_monthly(val) -> tuple[str, str]:
+    val = "" if pd.isna(val) else str(val).strip()
+    if " - " in val:
+        month, yn = val.split(" - ", 1)
+        return month.strip(), _yes_no(yn)
+    return "", "Unknown"
 
 
 def _parse_monthly_field(series: pd.Series) -> tuple[pd.Series, pd.Series]:
@@ -65,38 +92,32 @@ def _parse_monthly_field(series: pd.Series) -> tuple[pd.Series, pd.Series]:
     §8.3 — Split 'January - No' format into (month, yesno).
     Returns two Series: month_series, yesno_series.
     """
-    month_vals = []
-    yesno_vals = []
-    for val in series.fillna(""):
-        val = str(val).strip()
-        if " - " in val:
-            parts = val.split(" - ", 1)
-            month_vals.append(parts[0].strip())
-            yn = parts[1].strip().lower()
-            yesno_vals.append("Yes" if yn == "yes" else ("No" if yn == "no" else "Unknown"))
-        else:
-            month_vals.append("")
-            yesno_vals.append("Unknown" if val == "" or val.lower() == "nan" else "Unknown")
-    return pd.Series(month_vals, index=series.index), pd.Series(yesno_vals, index=series.index)
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    pairs = [_split_monthly(v) for v in uniques]
+    months = np.empty(len(pairs), dtype=object)
+    yesnos = np.empty(len(pairs), dtype=object)
+    months[:] = [m for m, _ in pairs]
+    yesnos[:] = [y for _, y in pairs]
+    return (
+        pd.Series(months[codes], index=series.index),
+        pd.Series(yesnos[codes], index=series.index),
+    )
+
+
+_IPC_CANONICAL = {
+    "not submitted": "Not Submitted",
+    "submitted": "Submitted",
+    "in process": "In Process",
+    "released": "Released",
+}
 
 
 def _normalize_ipc(series: pd.Series) -> pd.Series:
     """§8.5 — Normalize IPC status columns."""
-    valid = {"not submitted", "submitted", "in process", "released"}
-    canonical = {
-        "not submitted": "Not Submitted",
-        "submitted": "Submitted",
-        "in process": "In Process",
-        "released": "Released",
-    }
-
     def _norm(val):
-        v = str(val).strip().lower()
-        if v in canonical:
-            return canonical[v]
-        return IPC_BLANK_DEFAULT
+        return _IPC_CANONICAL.get(str(val).strip().lower(), IPC_BLANK_DEFAULT)
 
-    return series.map(_norm)
+    return pd.Series(_map_unique(series, _norm), index=series.index)
 
 
 def _clean_progress(series: pd.Series) -> pd.Series:
@@ -115,10 +136,11 @@ def _clean_progress(series: pd.Series) -> pd.Series:
 # Master cleaning pipeline
 # ---------------------------------------------------------------------------
 
-def clean_tasks(df: pd.DataFrame) -> pd.DataFrame:
+def clean_tasks(df: pd.DataFrame, today: pd.Timestamp | None = None) -> pd.DataFrame:
     """
     Full cleaning pipeline (§8.0 through §8.6).
     Expects column renaming already done by loader.
+    `today` overrides the Asia/Karachi business date used for task delays.
     """
     df = df.copy()
 
@@ -149,7 +171,7 @@ def clean_tasks(df: pd.DataFrame) -> pd.DataFrame:
         df["progress_pct"] = _clean_progress(df["progress_pct"])
 
     # §9.1 — Task-level delay
-    df = _compute_task_delay(df)
+    df = _compute_task_delay(df, today)
 
     # Task-level status (§9.5 precursor)
     df = _compute_task_status(df)
@@ -166,14 +188,23 @@ def _get_today():
     return pd.Timestamp.now(tz=tz.gettz(TIMEZONE)).normalize().tz_localize(None)
 
 
-def _compute_task_delay(df: pd.DataFrame) -> pd.DataFrame:
+def _task_delay_days(df: pd.DataFrame, today: pd.Timestamp) -> pd.Series:
+    """Days overdue as of today (clipped to 0; NaN if no planned_finish)."""
+    pf = df["planned_finish"]
+    af = df.get("actual_finish")
+    effective_finish = af.fillna(today) if af is not None else pd.Series(today, index=df.index)
+    return (effective_finish - pf).dt.days.clip(lower=0).astype("float64").where(pf.notna())
+
+
+def _compute_task_delay(df: pd.DataFrame, today: pd.Timestamp | None = None) -> pd.DataFrame:
     """§9.1 — Task-level delay (date-based).
 
     task_delay_days:    days overdue (clipped to 0; NaN if no planned_finish).
     task_duration_days: planned duration in days, used as weight in site-level
                         weighted-average delay aggregation (min 1 day).
     """
-    today = _get_today()
+    if today is None:
+        today = _get_today()
 
     pf = df.get("planned_finish")
     af = df.get("actual_finish")
@@ -184,13 +215,7 @@ def _compute_task_delay(df: pd.DataFrame) -> pd.DataFrame:
         df["task_duration_days"] = np.nan
         return df
 
-    effective_finish = af.copy() if af is not None else pd.Series(pd.NaT, index=df.index)
-    effective_finish = effective_finish.fillna(today)
-
-    raw_delay = (effective_finish - pf).dt.days
-    df["task_delay_days"] = raw_delay.clip(lower=0)
-    # Where planned_finish is missing → NaN
-    df.loc[pf.isna(), "task_delay_days"] = np.nan
+    df["task_delay_days"] = _task_delay_days(df, today)
 
     # Task duration (planned_finish − planned_start), minimum 1 day to avoid zero weights
     if ps is not None:
@@ -217,42 +242,84 @@ def _compute_task_status(df: pd.DataFrame) -> pd.DataFrame:
 # Build df_site (Layer B)
 # ---------------------------------------------------------------------------
 
-def _delay_bucket(delay_days):
-    """§9.3 — Map delay days to bucket label."""
-    if pd.isna(delay_days) or delay_days == 0:
-        return "On Track"
-    if delay_days <= DELAY_BUCKET_CUTOFFS[1]:
-        return "1-30"
-    if delay_days <= DELAY_BUCKET_CUTOFFS[2]:
-        return "31-60"
-    return ">60"
+def delay_bucket_labels(cutoffs=DELAY_BUCKET_CUTOFFS) -> list[str]:
+    """§9.3 — Bucket labels for delay cutoffs ("On Track", "1-30", "31-60", ">60")."""
+    labels = ["On Track"]
+    labels += [f"{lo + 1:g}-{hi:g}" for lo, hi in zip(cutoffs, cutoffs[1:])]
+    labels.append(f">{cutoffs[-1]:g}")
+    return labels
 
 
-def _delay_score(bucket: str) -> int:
-    """§9.7 — Delay component of risk score."""
-    return DELAY_SCORE_MAP.get(bucket, 0)
+def _delay_bucket_index(delay_days: pd.Series, cutoffs=DELAY_BUCKET_CUTOFFS) -> np.ndarray:
+    """Position of each delay in delay_bucket_labels(cutoffs) (NaN → On Track)."""
+    d = delay_days.to_numpy(dtype=float, na_value=np.nan)
+    return np.where(np.isnan(d), 0, np.digitize(d, cutoffs, right=True))
 
 
-def _progress_score(pct: float) -> int:
-    """§9.7 — Progress component of risk score."""
-    for lo, hi, score in PROGRESS_SCORE_BRACKETS:
-        if lo <= pct < hi:
-            return score
-    # pct >= 100
-    return 0
+def _progress_scores(progress: pd.Series, brackets=PROGRESS_SCORE_BRACKETS) -> np.ndarray:
+    """§9.7 — Progress component: score of the first [lo, hi) bracket, else 0."""
+    p = progress.to_numpy(dtype=float, na_value=np.nan)
+    return np.select(
+        [(lo <= p) & (p < hi) for lo, hi, _ in brackets],
+        [score for _, _, score in brackets],
+        default=0,
+    )
 
 
-def _best_ipc_status(row, ipc_cols):
-    """§9.8 — Best IPC status across IPC 1–6."""
-    best = "Not Submitted"
-    best_priority = 0
-    for col in ipc_cols:
-        val = row.get(col, IPC_BLANK_DEFAULT)
-        p = IPC_STATUS_PRIORITY.get(val, 0)
-        if p > best_priority:
-            best_priority = p
-            best = val
-    return best
+def score_sites(
+    df_site: pd.DataFrame,
+    delay_bucket_cutoffs=DELAY_BUCKET_CUTOFFS,
+    delay_score_map: dict | None = None,
+    progress_score_brackets=PROGRESS_SCORE_BRACKETS,
+    mobilization_penalty: float = 0,
+    mobilized: np.ndarray | None = None,
+) -> pd.DataFrame:
+    """
+    §9.3 / §9.7 — delay_bucket, delay_score, progress_score and risk_score
+    for every df_site row, on df_site's index. Parameters default to the
+    config values; delay_score_map defaults to DELAY_SCORE_MAP, re-keyed by
+    position when the cutoffs give other labels. mobilization_penalty is
+    added for sites flagged in mobilized (see mobilized_sites) whose
+    progress is below LOW_PROGRESS_THRESHOLD.
+    """
+    labels = delay_bucket_labels(delay_bucket_cutoffs)
+    if delay_score_map is None:
+        delay_score_map = dict(zip(labels, DELAY_SCORE_MAP.values()))
+    bucket = _delay_bucket_index(df_site["site_delay_days"], delay_bucket_cutoffs)
+    delay_score = np.array([delay_score_map.get(label, 0) for label in labels])[bucket]
+    progress_score = _progress_scores(df_site["site_progress"], progress_score_brackets)
+
+    risk_score = delay_score + progress_score
+    if mobilization_penalty and mobilized is not None:
+        low = df_site["site_progress"].to_numpy(dtype=float, na_value=np.nan) < LOW_PROGRESS_THRESHOLD
+        risk_score = risk_score + np.where(mobilized & low, mobilization_penalty, 0)
+
+    return pd.DataFrame({
+        "delay_bucket": np.array(labels)[bucket],
+        "delay_score": delay_score,
+        "progress_score": progress_score,
+        "risk_score": risk_score,
+    }, index=df_site.index)
+
+
+def mobilized_sites(df_site: pd.DataFrame, df_pkg: pd.DataFrame) -> np.ndarray:
+    """Per df_site row: does its package have mobilization_taken == "Yes" (package level)."""
+    if df_pkg.empty or "mobilization_taken" not in df_pkg.columns:
+        return np.zeros(len(df_site), dtype=bool)
+    packages = df_pkg.loc[df_pkg["mobilization_taken"] == "Yes", "package_name"]
+    return df_site["package_name"].isin(list(packages)).to_numpy()
+
+
+def _best_ipc_status(df: pd.DataFrame, ipc_cols: list[str]) -> pd.Series:
+    """§9.8 — Best IPC status across IPC 1–6 (highest IPC_STATUS_PRIORITY per row)."""
+    priority = np.column_stack([
+        df[col].astype(object).map(IPC_STATUS_PRIORITY).fillna(0).to_numpy(dtype=np.int64)
+        for col in ipc_cols
+    ])
+    stage_by_priority = {p: stage for stage, p in IPC_STATUS_PRIORITY.items()}
+    stage_by_priority[0] = "Not Submitted"
+    best = pd.Series(priority.max(axis=1, initial=0), index=df.index)
+    return best.map(stage_by_priority)
 
 
 def extract_package_metadata(df_tasks: pd.DataFrame) -> pd.DataFrame:
@@ -263,7 +330,7 @@ def extract_package_metadata(df_tasks: pd.DataFrame) -> pd.DataFrame:
     if df_tasks.empty:
         return pd.DataFrame()
     
-    pkg_grp = df_tasks.groupby("package_name", dropna=False)
+    pkg_grp = df_tasks.groupby("package_name", dropna=False, observed=True)
     
     metadata = {"package_name": pkg_grp.size().index.tolist()}
     
@@ -297,14 +364,50 @@ def extract_package_metadata(df_tasks: pd.DataFrame) -> pd.DataFrame:
     # Calculate best IPC stage
     ipc_cols_in_meta = [c for c in IPC_COLUMNS if c in df_pkg_meta.columns]
     if ipc_cols_in_meta:
-        df_pkg_meta["ipc_best_stage"] = df_pkg_meta.apply(
-            lambda row: _best_ipc_status(row, ipc_cols_in_meta),
-            axis=1
-        )
+        df_pkg_meta["ipc_best_stage"] = _best_ipc_status(df_pkg_meta, ipc_cols_in_meta)
     
     return df_pkg_meta
 
 
+def _site_delays(df_tasks: pd.DataFrame, keys: list) -> pd.DataFrame:
+    """
+    §9.2 — Site-level delay (duration-weighted average, split by task status).
+    `keys` group the tasks into sites (SITE_KEY columns or df_site positions).
+
+    active_delay_days     — weighted avg delay of In Progress tasks (current problems)
+    historical_delay_days — weighted avg delay of Completed tasks (past performance)
+    site_delay_days       — active delay when In Progress tasks are delayed;
+                            falls back to historical delay; 0 when both are NaN
+    """
+    delay = df_tasks["task_delay_days"]
+    weights = df_tasks["task_duration_days"].fillna(1.0)
+    status = df_tasks["task_status"]
+
+    def _weighted_avg_delay(status_value):
+        """Duration-weighted average of task_delay_days per site for one task status.
+
+        Equivalent to np.average per group: sum(delay * w) / sum(w) over the
+        matching tasks, NaN when a site has none.
+        """
+        mask = (status == status_value) & delay.notna()
+        w = weights.where(mask, 0.0)
+        sums = pd.DataFrame({
+            "wd": (delay * w).where(mask, 0.0),
+            "w": w,
+        }).groupby(keys, dropna=False, observed=True).sum()
+        return sums["wd"].where(sums["w"] > 0) / sums["w"].where(sums["w"] > 0)
+
+    active_delay = _weighted_avg_delay("In Progress")
+    historical_delay = _weighted_avg_delay("Completed")
+
+    # site_delay_days: prioritise active; fall back to historical; 0 if neither exists
+    return pd.DataFrame({
+        "site_delay_days": active_delay.combine_first(historical_delay).fillna(0),
+        "active_delay_days": active_delay,
+        "historical_delay_days": historical_delay,
+    })
+
+
 def build_site_summary(df_tasks: pd.DataFrame) -> pd.DataFrame:
     """
     Build df_site (Layer B) — one row per (package_name, district, site_name).
@@ -313,62 +416,45 @@ def build_site_summary(df_tasks: pd.DataFrame) -> pd.DataFrame:
     if df_tasks.empty:
         return pd.DataFrame()
 
-    grp = df_tasks.groupby(SITE_KEY, dropna=False)
-
-    # §9.2 — Site-level delay (duration-weighted average, split by task status)
-    #
-    # active_delay_days     — weighted avg delay of In Progress tasks (current problems)
-    # historical_delay_days — weighted avg delay of Completed tasks (past performance)
-    # site_delay_days       — active delay when In Progress tasks are delayed;
-    #                         falls back to historical delay; 0 when both are NaN
-
-    def _weighted_avg_delay(sub_df, status_filter):
-        """Duration-weighted average of task_delay_days for tasks matching status_filter."""
-        mask = sub_df["task_status"].isin(status_filter) & sub_df["task_delay_days"].notna()
-        filtered = sub_df[mask]
-        if filtered.empty:
-            return np.nan
-        weights = filtered["task_duration_days"].fillna(1.0)
-        return float(np.average(filtered["task_delay_days"], weights=weights))
-
-    active_delay = grp.apply(
-        lambda s: _weighted_avg_delay(s, ["In Progress"]),
-        include_groups=False,
-    ).rename("active_delay_days")
-
-    historical_delay = grp.apply(
-        lambda s: _weighted_avg_delay(s, ["Completed"]),
-        include_groups=False,
-    ).rename("historical_delay_days")
+    grp = df_tasks.groupby(SITE_KEY, dropna=False, observed=True)
 
-    # site_delay_days: prioritise active; fall back to historical; 0 if neither exists
-    site_delay = active_delay.combine_first(historical_delay).fillna(0).rename("site_delay_days")
+    status = df_tasks["task_status"]
+    keys = [df_tasks[c] for c in SITE_KEY]
+
+    # §9.2 — Site-level delay
+    delays = _site_delays(df_tasks, keys)
 
     # §9.4 — Discipline-balanced site progress
     disc_key = SITE_KEY + ["discipline"]
     disc_progress = (
-        df_tasks.groupby(disc_key, dropna=False)["progress_pct"]
+        df_tasks.groupby(disc_key, dropna=False, observed=True)["progress_pct"]
         .mean()
         .reset_index()
         .rename(columns={"progress_pct": "discipline_progress"})
     )
     site_progress = (
-        disc_progress.groupby(SITE_KEY, dropna=False)["discipline_progress"]
+        disc_progress.groupby(SITE_KEY, dropna=False, observed=True)["discipline_progress"]
         .mean()
         .rename("site_progress")
     )
 
     # §9.5 — Site status
-    def _site_status_agg(sub):
-        statuses = set(sub["task_status"])
-        progress = site_progress.get(tuple(sub.name) if isinstance(sub.name, tuple) else sub.name, 0)
-        if statuses == {"Not Started"}:
-            return "Inactive"
-        if progress >= COMPLETION_THRESHOLD:
-            return "Completed"
-        return "Active"
-
-    site_status = grp.apply(_site_status_agg, include_groups=False).rename("site_status")
+    # Inactive when every task is Not Started; otherwise Completed/Active by progress.
+    # Sites with a missing district get their real progress too: the former
+    # per-site dict lookup never matched NaN keys and left them Active.
+    task_count = grp.size()
+    not_started = (status == "Not Started").groupby(keys, dropna=False, observed=True).sum()
+    progress = site_progress.reindex(task_count.index).fillna(0)
+    site_status = pd.Series(
+        np.select(
+            [not_started.reindex(task_count.index) == task_count,
+             progress >= COMPLETION_THRESHOLD],
+            ["Inactive", "Completed"],
+            default="Active",
+        ),
+        index=task_count.index,
+        name="site_status",
+    )
 
     # NOTE: Mobilization, CESMPS, OHS, RFB, and IPC are package-level attributes
     # They are extracted via extract_package_metadata() and merged at package level
@@ -384,22 +470,22 @@ def build_site_summary(df_tasks: pd.DataFrame) -> pd.DataFrame:
     if "planned_start" in df_tasks.columns:
         earliest_start = grp["planned_start"].min().rename("earliest_planned_start")
     else:
-        earliest_start = pd.Series(pd.NaT, index=site_delay.index, name="earliest_planned_start")
+        earliest_start = pd.Series(pd.NaT, index=delays.index, name="earliest_planned_start")
 
     # Last updated
     if "last_updated" in df_tasks.columns:
         last_upd = grp["last_updated"].max().rename("last_updated")
     else:
-        last_upd = pd.Series(pd.NaT, index=site_delay.index, name="last_updated")
+        last_upd = pd.Series(pd.NaT, index=delays.index, name="last_updated")
 
     # Task count
-    task_count = grp.size().rename("task_count")
+    task_count = task_count.rename("task_count")
 
     # Assemble df_site
     df_site = pd.DataFrame({
-        "site_delay_days": site_delay,
-        "active_delay_days": active_delay,
-        "historical_delay_days": historical_delay,
+        "site_delay_days": delays["site_delay_days"],
+        "active_delay_days": delays["active_delay_days"],
+        "historical_delay_days": delays["historical_delay_days"],
         "site_progress": site_progress,
         "site_status": site_status,
         "earliest_planned_start": earliest_start,
@@ -415,18 +501,56 @@ def build_site_summary(df_tasks: pd.DataFrame) -> pd.DataFrame:
 
     # --- Derived fields ---
 
-    # §9.3 — Delay bucket
-    df_site["delay_bucket"] = df_site["site_delay_days"].apply(_delay_bucket)
+    # §9.3 / §9.7 — Delay bucket and risk score (without mobilization component for now)
+    scores = score_sites(df_site)
+    for col in scores.columns:
+        df_site[col] = scores[col].to_numpy()
+
+    return df_site
 
-    # §9.7 — Risk score (without mobilization component for now)
-    df_site["delay_score"] = df_site["delay_bucket"].map(_delay_score)
-    df_site["progress_score"] = df_site["site_progress"].apply(_progress_score)
-    df_site["risk_score"] = (
-        df_site["delay_score"] +
-        df_site["progress_score"]
+
+# ---------------------------------------------------------------------------
+# Date-dependent stage (business-date rollover)
+# ---------------------------------------------------------------------------
+
+def recompute_date_columns(
+    df_tasks: pd.DataFrame,
+    df_site: pd.DataFrame,
+    today: pd.Timestamp | None = None,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Re-evaluate only the columns that depend on today's date: task_delay_days
+    (§9.1), the site delays (§9.2), delay_bucket (§9.3) and delay_score /
+    risk_score (§9.7). Cleaning, statuses and progress are date-independent,
+    so a new business date needs neither a refetch nor a rebuild.
+    Returns new (df_tasks, df_site) that share every other column with the
+    inputs (e.g. memory-mapped cache columns); the inputs are not modified.
+    """
+    if df_tasks.empty or df_site.empty:
+        return df_tasks, df_site
+    if today is None:
+        today = _get_today()
+
+    if "planned_finish" in df_tasks.columns:
+        df_tasks = df_tasks.assign(task_delay_days=_task_delay_days(df_tasks, today))
+    else:
+        df_tasks = df_tasks.assign(task_delay_days=np.nan)
+
+    # Map each task to its df_site row; merge matches NaN keys like groupby(dropna=False)
+    site_pos = (
+        df_tasks[SITE_KEY]
+        .merge(df_site[SITE_KEY].assign(_site_pos=np.arange(len(df_site))), on=SITE_KEY, how="left")
+        ["_site_pos"]
+        .fillna(-1)
+        .astype(np.int64)
     )
+    site_pos.index = df_tasks.index
+    delays = _site_delays(df_tasks, [site_pos]).reindex(np.arange(len(df_site)))
 
-    return df_site
+    df_site = df_site.assign(**{col: delays[col].to_numpy() for col in delays.columns})
+    scores = score_sites(df_site)
+    df_site = df_site.assign(**{col: scores[col].to_numpy() for col in scores.columns})
+    return df_tasks, df_site
 
 
 # ---------------------------------------------------------------------------
@@ -438,17 +562,28 @@ def build_package_summary(df_site: pd.DataFrame, df_pkg_meta: pd.DataFrame = Non
     if df_site.empty:
         return pd.DataFrame()
 
-    grp = df_site.groupby("package_name", dropna=False)
+    status = df_site["site_status"]
+    delay = df_site["site_delay_days"]
+    flags = pd.DataFrame({
+        "package_name": df_site["package_name"],
+        "site_progress": df_site["site_progress"],
+        "active": status == "Active",
+        "inactive": status == "Inactive",
+        "completed": status == "Completed",
+        "gt30": delay > 30,
+        "gt60": delay > 60,
+    })
 
-    df_pkg = pd.DataFrame({
-        "total_sites": grp.size(),
-        "avg_progress": grp["site_progress"].mean(),
-        "active_sites": grp["site_status"].apply(lambda s: (s == "Active").sum()),
-        "inactive_sites": grp["site_status"].apply(lambda s: (s == "Inactive").sum()),
-        "completed_sites": grp["site_status"].apply(lambda s: (s == "Completed").sum()),
-        "sites_gt30_delayed": grp["site_delay_days"].apply(lambda s: (s > 30).sum()),
-        "sites_gt60_delayed": grp["site_delay_days"].apply(lambda s: (s > 60).sum()),
-    }).reset_index()
+    # One pass over the groups: counts are sums of the boolean flags
+    df_pkg = flags.groupby("package_name", dropna=False, observed=True).agg(
+        total_sites=("package_name", "size"),
+        avg_progress=("site_progress", "mean"),
+        active_sites=("active", "sum"),
+        inactive_sites=("inactive", "sum"),
+        completed_sites=("completed", "sum"),
+        sites_gt30_delayed=("gt30", "sum"),
+        sites_gt60_delayed=("gt60", "sum"),
+    ).reset_index()
 
     # Merge package-level metadata (CESMPS, OHS, RFB, IPC, mobilization)
     if df_pkg_meta is not None and not df_pkg_meta.empty:
@@ -462,13 +597,148 @@ def build_district_summary(df_site: pd.DataFrame) -> pd.DataFrame:
     if df_site.empty:
         return pd.DataFrame()
 
-    grp = df_site.groupby(["package_name", "district"], dropna=False)
+    flags = pd.DataFrame({
+        "package_name": df_site["package_name"],
+        "district": df_site["district"],
+        "site_progress": df_site["site_progress"],
+        "gt60": df_site["site_delay_days"] > 60,
+        "inactive": df_site["site_status"] == "Inactive",
+    })
 
-    df_dist = pd.DataFrame({
-        "total_sites": grp.size(),
-        "avg_progress": grp["site_progress"].mean().round(1),
-        "sites_gt60_delayed": grp["site_delay_days"].apply(lambda s: (s > 60).sum()),
-        "inactive_sites": grp["site_status"].apply(lambda s: (s == "Inactive").sum()),
-    }).reset_index()
+    df_dist = flags.groupby(["package_name", "district"], dropna=False, observed=True).agg(
+        total_sites=("package_name", "size"),
+        avg_progress=("site_progress", "mean"),
+        sites_gt60_delayed=("gt60", "sum"),
+        inactive_sites=("inactive", "sum"),
+    ).reset_index()
+    df_dist["avg_progress"] = df_dist["avg_progress"].round(1)
 
     return df_dist
+
+
+# ---------------------------------------------------------------------------
+# Trend rollups (one row per snapshot and level, written at snapshot time)
+# ---------------------------------------------------------------------------
+
+TREND_ROLLUP_LEVELS = {
+    "global": [],
+    "package": ["package_name"],
+    "district": ["package_name", "district"],
+}
+
+_ROLLUP_BUCKETS = {"On Track": "bucket_on_track", "1-30": "bucket_1_30",
+                   "31-60": "bucket_31_60", ">60": "bucket_gt60"}
+_ROLLUP_STATUSES = {"Active": "status_active", "Inactive": "status_inactive",
+                    "Completed": "status_completed"}
+
+
+def build_trend_rollup(df_snapshots: pd.DataFrame) -> pd.DataFrame:
+    """
+    Aggregate snapshot rows (df_site plus _snapshot_ts) to the trend series:
+    per snapshot, one global row, one per package and one per district with
+    site count, average progress / risk score, completed sites and the
+    delay-bucket and site-status counts.
+    """
+    if df_snapshots.empty:
+        return pd.DataFrame()
+
+    def column(name):
+        if name in df_snapshots.columns:
+            return df_snapshots[name]
+        return pd.Series(np.nan, index=df_snapshots.index)
+
+    flags = pd.DataFrame({
+        "_snapshot_ts": df_snapshots["_snapshot_ts"],
+        "package_name": column("package_name"),
+        "district": column("district"),
+        "site_progress": column("site_progress"),
+        "risk_score": column("risk_score"),
+        "completed": column("site_progress") >= COMPLETION_THRESHOLD,
+    })
+    aggs = {
+        "total_sites": ("_snapshot_ts", "size"),
+        "avg_progress": ("site_progress", "mean"),
+        "avg_risk_score": ("risk_score", "mean"),
+        "completed_sites": ("completed", "sum"),
+    }
+    for values, names in (("delay_bucket", _ROLLUP_BUCKETS), ("site_status", _ROLLUP_STATUSES)):
+        for value, name in names.items():
+            flags[name] = column(values) == value
+            aggs[name] = (name, "sum")
+
+    levels = []
+    for level, keys in TREND_ROLLUP_LEVELS.items():
+        rows = flags.groupby(["_snapshot_ts", *keys], dropna=False, observed=True).agg(**aggs)
+        rows = rows.reset_index()
+        rows.insert(0, "level", level)
+        levels.append(rows)
+    return concat_frames(levels, ignore_index=True)[
+        ["level", "_snapshot_ts", "package_name", "district", *aggs]
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Compact representation (categoricals + downcast integers)
+# ---------------------------------------------------------------------------
+
+_INT32 = np.iinfo(np.int32)
+
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Store COMPACT_CATEGORY_COLUMNS as categoricals and downcast int64 columns
+    to int32 where the values fit. Categories are sorted, so sorting and
+    equality masks behave exactly as on plain strings. Floats are left at
+    float64 so delays, progress and scores stay bit-identical.
+    No-op when COMPACT_FRAMES is off.
+    """
+    if not COMPACT_FRAMES or df is None or df.empty:
+        return df
+
+    updates = {}
+    for col in COMPACT_CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            updates[col] = df[col].astype("category")
+    for col in df.select_dtypes(include="integer").columns:
+        s = df[col]
+        if s.dtype.itemsize > 4 and s.between(_INT32.min, _INT32.max).all():
+            updates[col] = s.astype(np.int32)
+    return df.assign(**updates) if updates else df
+
+
+def concat_frames(frames: list[pd.DataFrame], **kwargs) -> pd.DataFrame:
+    """
+    pd.concat that keeps categorical columns categorical: each one is recast
+    to the sorted union of its categories first (plain pd.concat falls back
+    to object when the categories differ).
+    """
+    frames = list(frames)
+    cat_cols = {
+        col for f in frames for col, dtype in f.dtypes.items()
+        if isinstance(dtype, pd.CategoricalDtype)
+    }
+    if not cat_cols or len(frames) < 2:
+        return pd.concat(frames, **kwargs)
+
+    dtypes = {}
+    for col in cat_cols:
+        cats = [
+            f[col].cat.categories if isinstance(f[col].dtype, pd.CategoricalDtype)
+            else pd.Index(f[col].dropna().unique())
+            for f in frames if col in f.columns
+        ]
+        # All-null columns carry empty categories of a different dtype
+        cats = [c for c in cats if len(c)]
+        union = cats[0].append(cats[1:]).unique().sort_values() if cats else pd.Index([])
+        dtypes[col] = pd.CategoricalDtype(union)
+
+    aligned = []
+    for f in frames:
+        current = f.dtypes
+        updates = {
+            col: f[col].astype(dtype) for col, dtype in dtypes.items()
+            if col in current.index and current[col] != dtype
+        }
+        aligned.append(f.assign(**updates) if updates else f)
+    return pd.concat(aligned, **kwargs)
+